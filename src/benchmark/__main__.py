@@ -0,0 +1,11 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+from benchmark.main import main
+
+main()
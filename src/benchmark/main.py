@@ -0,0 +1,129 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+
+Benchmark program
+
+Reports the memory used per game state and per search tree node, which limits how large the
+search trees can grow within the space limit, and per evaluation cache entry, which limits how
+large the evaluation cache can be made.
+Takes an optional number of nodes to allocate from the command line.
+"""
+
+import sys
+import random
+import tracemalloc
+from state.game_state import GameState
+from state.node_mcts_duct import Node
+from strategy.mcts_duct import monte_carlo_tree_search
+from strategy.evaluation import evaluate_state
+from strategy.evaluation_cache import evaluation_cache
+
+DEFAULT_NUM_NODES = 2000
+NUM_SETUP_TURNS = 40
+NUM_SEARCH_ITERATIONS = 300
+
+
+def main():
+    if len(sys.argv) >= 2:
+        num_nodes = int(sys.argv[1])
+    else:
+        num_nodes = DEFAULT_NUM_NODES
+
+    random.seed(30024)
+    game_state = play_random_turns(NUM_SETUP_TURNS)
+    print(f"Position after {game_state.turn} turns: "
+        + f"{game_state.num_friends()} friends, {game_state.num_enemies()} enemies")
+
+    report("GameState copy", measure(game_state.copy, num_nodes))
+    report("DUCT Node", measure(lambda: Node(game_state.copy()), num_nodes))
+
+    # A first search so that lazy imports and module level state aren't counted
+    measure_search(Node(game_state.copy()))
+    bytes_used, num_tree_nodes = measure_search(Node(game_state.copy()))
+    print(f"{'DUCT search tree':20} {bytes_used / num_tree_nodes:8.0f} bytes per node ({num_tree_nodes} nodes)")
+
+    report("Evaluation cache", measure_evaluation_cache(game_state, num_nodes), "entry")
+
+
+def play_random_turns(num_turns):
+    """
+    Return the game state reached by both sides making random moves
+    """
+    game_state = GameState()
+    for _ in range(num_turns):
+        friend_transitions = game_state.next_friend_transitions()
+        enemy_transitions = game_state.next_enemy_transitions()
+        game_state.update(random.choice(friend_transitions), random.choice(enemy_transitions))
+    return game_state
+
+
+def measure(make_object, num_objects):
+    """
+    Return the average number of bytes allocated by each call of make_object
+    """
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = [make_object() for _ in range(num_objects)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / len(objects)
+
+
+def measure_search(root: Node):
+    """
+    Run a fixed number of DUCT iterations and return the bytes held by the tree and its node count
+    """
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    monte_carlo_tree_search(
+        root,
+        playout_amount=3,
+        outer_cutoff=4,
+        num_iterations=NUM_SEARCH_ITERATIONS,
+        exploration_constant=0.8,
+    )
+    # Only count the memory held by the tree
+    GameState.move_cache.clear()
+    evaluation_cache.clear()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return after - before, count_nodes(root)
+
+
+def measure_evaluation_cache(game_state: GameState, num_states):
+    """
+    Return the average number of bytes the evaluation cache holds per entry
+    """
+    states = []
+    for friend_transition, enemy_transition in game_state.next_transitions():
+        if len(states) == num_states:
+            break
+        child = game_state.copy()
+        child.update(friend_transition, enemy_transition)
+        states.append(child)
+
+    evaluation_cache.clear()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for child in states:
+        evaluate_state(child)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / len(evaluation_cache)
+
+
+def count_nodes(node: Node):
+    count = 1
+    for row in node.matrix:
+        for child in row:
+            if child is not None:
+                count += count_nodes(child)
+    return count
+
+
+def report(name, bytes_per_object, unit="node"):
+    print(f"{name:20} {bytes_per_object:8.0f} bytes per {unit}")
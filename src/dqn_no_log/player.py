@@ -38,9 +38,9 @@ class Player:
         
         if random.random() < self.explore_rate:
             transitions = self.game_state.next_transitions_for_side(True)
-            return transitions[random.randrange(len(transitions))]
+            return GameState.decode_move(transitions[random.randrange(len(transitions))])
 
-        return minimax_paranoid_reduction(self.game_state)
+        return GameState.decode_move(minimax_paranoid_reduction(self.game_state))
         
     def update(self, opponent_action, player_action):
         """
@@ -50,7 +50,7 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.game_state.update(player_action, opponent_action)
+        self.game_state.update(GameState.encode_move(player_action), GameState.encode_move(opponent_action))
 
 
 
@@ -30,7 +30,7 @@ class Player:
         # takes about 0.002s per turn
         choice = eval.greedy_choose(self.game_state)
 
-        return choice
+        return GameState.decode_move(choice)
 
     def update(self, opponent_action, player_action):
         """
@@ -40,5 +40,5 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.game_state.update(player_action, opponent_action)
+        self.game_state.update(GameState.encode_move(player_action), GameState.encode_move(opponent_action))
         something = 5
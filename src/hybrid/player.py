@@ -10,6 +10,7 @@ Kevin Russell 1084088
 from time import time
 from state.game_state import GameState
 from strategy.mcts_duct import Node, monte_carlo_tree_search
+from strategy.mcts_duct_parallel import root_parallel_search
 from strategy.evaluation import greedy_choose
 from strategy.minimax import minimax_paranoid_reduction
 from strategy.book import book_first_four_moves
@@ -19,6 +20,14 @@ from scipy.stats import norm
 
 class Player:
 
+    # Worker processes for a root parallel DUCT search, 0 searches in this process. Each worker
+    # searches for up to WORKER_TURN_TIME seconds or WORKER_ITERATIONS iterations. The workers
+    # start from a fresh tree and only the merged root statistics come back, so with workers the
+    # subtree that make_updated_node keeps between turns is not reused.
+    NUM_WORKERS = 0
+    WORKER_TURN_TIME = 0.75
+    WORKER_ITERATIONS = 1200
+
     def __init__(self, player):
         """
         Called once at the beginning of a game to initialise this player.
@@ -53,27 +62,28 @@ class Player:
             elif use_minimax:
                 result = minimax_paranoid_reduction(self.root)
             else:
-               result = monte_carlo_tree_search(
-                   self.root,
+               search_options = dict(
                    playout_amount=3,
-                   node_cutoff=4,
                    outer_cutoff=4,
-                   num_iterations=1200,
-                   turn_time=0.75,
+                   num_iterations=self.WORKER_ITERATIONS,
+                   turn_time=self.WORKER_TURN_TIME,
                    exploration_constant=1.7,
-                   use_slow_culling=False,
                    verbosity=0,
                    use_prior=True,
                    num_priors=4,
                    use_fast_prune_eval=False,
                    use_fast_rollout_eval=False,
                )
+               if self.NUM_WORKERS > 0:
+                   result = root_parallel_search(self.root, num_workers=self.NUM_WORKERS, **search_options)
+               else:
+                   result = monte_carlo_tree_search(self.root, **search_options)
         else:
             result = greedy_choose(self.root)
 
         self.end_timer()
 
-        return result
+        return GameState.decode_move(result)
 
     def update(self, opponent_action, player_action):
         """0
@@ -84,7 +94,8 @@ class Player:
         and player_action is this instance's latest chosen action.
         """
 
-        self.root = self.root.make_updated_node(player_action, opponent_action)
+        self.root = self.root.make_updated_node(
+            GameState.encode_move(player_action), GameState.encode_move(opponent_action))
 
     def start_timer(self):
         self.start_time = time()
@@ -42,22 +42,21 @@ class Player:
             result = monte_carlo_tree_search(
                 self.root, 
                 playout_amount = 3, 
-                node_cutoff = 6,
                 outer_cutoff = 6,
                 num_iterations = 9000, 
                 turn_time = 1, 
                 exploration_constant = 0.8,
-                use_slow_culling = False,
                 verbosity = 1,
                 use_prior = True,
                 num_priors = 4,
                 use_fast_prune_eval=False,
                 use_fast_rollout_eval=False,
+                use_ml_leaf_eval=False,
             )
 
         self.end_timer()
 
-        return result
+        return GameState.decode_move(result)
 
     def update(self, opponent_action, player_action):
         """
@@ -68,7 +67,8 @@ class Player:
         and player_action is this instance's latest chosen action.
         """
 
-        self.root = self.root.make_updated_node(player_action,opponent_action)
+        self.root = self.root.make_updated_node(
+            GameState.encode_move(player_action), GameState.encode_move(opponent_action))
         asda=4
 
     def start_timer(self):
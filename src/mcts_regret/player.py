@@ -33,9 +33,9 @@ class Player:
 
         random_turns = 20
         if self.root.turn < random_turns:
-            return greedy_choose(self.root)
+            return GameState.decode_move(greedy_choose(self.root))
         else:
-            return monte_carlo_tree_search(self.root, 10)
+            return GameState.decode_move(monte_carlo_tree_search(self.root, 10))
 
 
     def update(self, opponent_action, player_action):
@@ -46,4 +46,5 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.root = self.root.make_updated_node(player_action, opponent_action)
+        self.root = self.root.make_updated_node(
+            GameState.encode_move(player_action), GameState.encode_move(opponent_action))
@@ -28,7 +28,7 @@ class Player:
         of the game, select an action to play this turn.
         """
 
-        return minimax_equilibrium(self.game_state, depth=1, cutoff_range=100000)
+        return GameState.decode_move(minimax_equilibrium(self.game_state, depth=1, cutoff_range=100000))
         
     def update(self, opponent_action, player_action):
         """
@@ -38,7 +38,7 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.game_state.update(player_action, opponent_action)
+        self.game_state.update(GameState.encode_move(player_action), GameState.encode_move(opponent_action))
 
     
 
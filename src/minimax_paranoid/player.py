@@ -48,7 +48,7 @@ class Player:
 
         self.end_timer()
 
-        return result
+        return GameState.decode_move(result)
 
         
     def update(self, opponent_action, player_action):
@@ -59,7 +59,7 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.game_state.update(player_action, opponent_action)
+        self.game_state.update(GameState.encode_move(player_action), GameState.encode_move(opponent_action))
 
     
     def start_timer(self):
@@ -22,7 +22,7 @@ class Player:
         """
 
         transitions = self.game_state.next_transitions_for_side(True)
-        return transitions[randrange(len(transitions))]
+        return GameState.decode_move(transitions[randrange(len(transitions))])
     
     def update(self, opponent_action, player_action):
         """
@@ -32,7 +32,7 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.game_state.update(player_action, opponent_action)
+        self.game_state.update(GameState.encode_move(player_action), GameState.encode_move(opponent_action))
         
 
 
@@ -30,7 +30,7 @@ class Player:
         Called at the beginning of each turn. Based on the current state
         of the game, select an action to play this turn.
         """
-        return biased_random_move(self.game_state, is_friend=True)
+        return GameState.decode_move(biased_random_move(self.game_state, is_friend=True))
     
 
     def update(self, opponent_action, player_action):
@@ -41,6 +41,6 @@ class Player:
         The parameter opponent_action is the opponent's chosen action,
         and player_action is this instance's latest chosen action.
         """
-        self.game_state.update(player_action, opponent_action)
+        self.game_state.update(GameState.encode_move(player_action), GameState.encode_move(opponent_action))
 
 
@@ -0,0 +1,40 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+"""
+Small helpers for working with integer bitmasks where bit i represents hex i of the board
+"""
+
+
+def iter_bits(mask):
+    """
+    Return a list of the indices of the set bits in mask, lowest first
+    """
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+def popcount(mask):
+    """
+    Return the number of set bits in mask
+    """
+    return bin(mask).count("1")
+
+
+def mask_from_indices(indices):
+    """
+    Return a bitmask with the bits for all of the given indices set
+    """
+    mask = 0
+    for i in indices:
+        mask |= 1 << i
+    return mask
@@ -6,19 +6,47 @@ David Peel 964682
 Kevin Russell 1084088
 """
 
-from state.location import loc_add
+from state.location import loc_add, distance_table
+from state.bitboard import mask_from_indices
+from state.move import SLIDE, SWING, pack_move
 
 
 class Board:
 
     def __init__(self, slide_options):
         self.locations = Board.__locations()
+        # Dense 0..60 indexing of the hexes, used by the bitboard game state
+        self.hexes = tuple(sorted(self.locations))
+        self.hex_index = {loc: i for i, loc in enumerate(self.hexes)}
         self.slide_options = slide_options
         self.slide_lookup = self.__compute_slide()
         self.swing_lookup = self.__compute_swing()
         self.lower_throw_lookup = self.__compute_lower_throw()
         self.upper_throw_lookup = self.__compute_upper_throw()
 
+        # Flat tables that work entirely in hex indices
+        self.num_hexes = len(self.hexes)
+        self.rows = tuple(r for (r, _) in self.hexes)
+        self.neighbours = self.__compute_neighbours()
+        self.slide_masks = tuple(mask_from_indices(n) for n in self.neighbours)
+        self.swing_destinations = self.__compute_swing_destinations()
+        self.swing_masks = tuple(mask_from_indices(d) for d in self.swing_destinations)
+        # Packed moves, slide_moves[origin] and swing_moves[origin * num_hexes + pivot]
+        self.slide_moves = tuple(
+            tuple(pack_move(SLIDE, i, j) for j in self.neighbours[i]) for i in range(self.num_hexes))
+        self.swing_moves = tuple(
+            tuple(pack_move(SWING, index // self.num_hexes, j) for j in destinations)
+            for index, destinations in enumerate(self.swing_destinations))
+        self.lower_throw_zones = self.__compute_throw_zones(self.lower_throw_lookup)
+        self.upper_throw_zones = self.__compute_throw_zones(self.upper_throw_lookup)
+        self.lower_throw_masks = tuple(mask_from_indices(z) for z in self.lower_throw_zones)
+        self.upper_throw_masks = tuple(mask_from_indices(z) for z in self.upper_throw_zones)
+        self.distances = distance_table(self.hexes)
+        self.distance_rows = tuple(
+            self.distances[i * self.num_hexes:(i + 1) * self.num_hexes] for i in range(self.num_hexes))
+        self.max_distance = max(self.distances)
+        self.distance_balls = self.__compute_distance_balls()
+
     @staticmethod
     def __locations():
         """
@@ -48,6 +76,34 @@ class Board:
         
         return self.lower_throw_lookup[throw_count]
 
+    def get_swing_destinations(self, origin, pivot):
+        """
+        Indices of the hexes a token on the origin index can swing to using an ally on the pivot 
+        index. Empty if the two hexes are not adjacent.
+        """
+        return self.swing_destinations[origin * self.num_hexes + pivot]
+
+    def hex_indices(self, locations):
+        """
+        Tuple of the hex indices of the given locations
+        """
+        return tuple(self.hex_index[loc] for loc in locations)
+
+    def distance(self, i, j):
+        """
+        Integer hex distance between the hexes with index i and j
+        """
+        return self.distances[i * self.num_hexes + j]
+
+    def get_throw_zone(self, upper, throw_count):
+        """
+        Indices of the hexes a side can throw to, given the number of throws it has used.
+        """
+        if upper:
+            return self.upper_throw_zones[throw_count]
+
+        return self.lower_throw_zones[throw_count]
+
     def __compute_slide(self):
         slide_lookup = {}
 
@@ -61,6 +117,49 @@ class Board:
 
         return slide_lookup
 
+    def __compute_neighbours(self):
+        """
+        Sorted tuple of the indices of the neighbouring hexes for each hex index
+        """
+        return tuple(
+            tuple(sorted(self.hex_index[n] for n in self.slide_lookup[loc]))
+            for loc in self.hexes
+        )
+
+    def __compute_swing_destinations(self):
+        """
+        Flat table of swing destinations indexed by origin * num_hexes + pivot
+        """
+        swing_destinations = [()] * (self.num_hexes * self.num_hexes)
+        for loc, pivots in self.swing_lookup.items():
+            origin = self.hex_index[loc]
+            for pivot_loc, destinations in pivots.items():
+                pivot = self.hex_index[pivot_loc]
+                swing_destinations[origin * self.num_hexes + pivot] = tuple(
+                    sorted(self.hex_index[d] for d in destinations))
+        return tuple(swing_destinations)
+
+    def __compute_distance_balls(self):
+        """
+        For each hex index, a tuple of bitmasks where entry d holds all hexes within distance d
+        """
+        return tuple(
+            tuple(
+                mask_from_indices(j for j, dist in enumerate(self.distance_rows[i]) if dist <= d)
+                for d in range(self.max_distance + 1)
+            )
+            for i in range(self.num_hexes)
+        )
+
+    def __compute_throw_zones(self, throw_lookup):
+        """
+        Tuple of the sorted hex indices in each throw zone, indexed by throw count
+        """
+        return tuple(
+            tuple(sorted(self.hex_index[loc] for loc in throw_lookup[throw]))
+            for throw in range(len(throw_lookup))
+        )
+
     def __compute_swing(self):
         swing_lookup = {}
         for loc in self.locations:
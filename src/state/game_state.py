@@ -1,10 +1,16 @@
 from enum import Enum
 from copy import deepcopy
-from itertools import product
+from itertools import chain, product
 from referee.game import Game
 from state.board import Board
-from state.location import distance
-from state.token import defeat_token
+from state.token import SYMBOLS, SYMBOL_INDEX, DEFEATS, BATTLE_DEFEATED
+from state.bitboard import iter_bits
+from state.zobrist import STACK_KEYS, THROW_KEYS
+from state.zobrist import stacks_key as stacks_key_from
+from state.move_cache import MoveCache
+from state.throw_pruning import ThrowPlans
+import state.move as moves
+from state.move import THROW, ORIGIN_SHIFT, DESTINATION_SHIFT, INDEX_MASK, pack_move, move_symbol
 import collections
 
 MAX_REPEATED_MOVES = 3
@@ -17,10 +23,20 @@ class Phase(Enum):
 
 class GameState:
 
+    __slots__ = (
+        'phase', 'is_upper', 'turn', 'friend_throws', 'enemy_throws', 'boards', 'counts',
+        'totals', 'stacks_key', 'existing_moves', 'pruning_is_aggressive', 'branching', 'goal'
+    )
+
     MAX_THROWS = 9
     MAX_TURNS = 360
     MAX_THROW_ENEMY_DISTANCE = 2
     MAX_THROW_ENEMY_DISTANCE_AGGRESSIVE = 0
+    # Distance field value for hexes when there are no tokens to measure to, more than any distance
+    NO_TOKEN_DISTANCE = 9
+    # Value of goal before the goal reward of the current position has been found
+    GOAL_UNKNOWN = 2
+    MOVE_CACHE_SIZE = 4096
 
     distant_throw_options = {
         4: ((4, -3), (4, -2), (4, -1)),
@@ -36,6 +52,15 @@ class GameState:
 
     slide_options = [(r, q) for r in [-1, 0, 1] for q in [-1, 0, 1] if (abs(r + q) < 2) and (r != 0 or q != 0)]
     board = Board(slide_options)
+    hexes = board.hexes
+    hex_index = board.hex_index
+    NUM_HEXES = len(hexes)
+    # Shared by every game state, see __cached_moves
+    move_cache = MoveCache(MOVE_CACHE_SIZE)
+    # Hex indices of distant_throw_options
+    distant_throw_indices = dict(zip(distant_throw_options, map(board.hex_indices, distant_throw_options.values())))
+    throw_plans = ThrowPlans(
+        board, distant_throw_indices, MAX_THROWS, MAX_THROW_ENEMY_DISTANCE, MAX_THROW_ENEMY_DISTANCE_AGGRESSIVE)
 
     def __init__(
         self, is_upper=True, 
@@ -46,54 +71,281 @@ class GameState:
         enemies=None, 
         existing_moves=None, 
         pruning_is_aggressive=True, 
-        prev_branching=0
+        prev_branching=0,
+        boards=None,
+        counts=None,
+        stacks_key=None,
+        totals=None
     ):
+        """
+        The board is stored as bitboards. boards holds one integer bitmask per (side, symbol) plane,
+        where the planes are ordered friend r, p, s then enemy r, p, s and bit i is set if the hex
+        with index i holds at least one such token. counts holds the number of tokens of each plane
+        on each hex, indexed by hex index * 6 + plane so that the counts of one hex are adjacent.
+        totals holds the number of tokens of each plane on the whole board.
+
+        friends and enemies may alternatively be given as dicts of type {(r, q): [token, ...]}
+
+        stacks_key is the Zobrist key of the tokens on the board, it is kept up to date whenever a
+        count changes. The throw counts are added to it by the key property.
+
+        goal memoises strategy.evaluation.goal_reward for the current position and is reset to
+        GOAL_UNKNOWN whenever the state changes.
+        """
         self.phase = Phase.EARLY
+        self.goal = GameState.GOAL_UNKNOWN
         self.is_upper = is_upper
         self.turn = turn
         self.friend_throws = friend_throws
         self.enemy_throws = enemy_throws
-        self.friends = {} if friends is None else friends
-        self.enemies = {} if enemies is None else enemies
+        if boards is None:
+            self.boards = [0] * 6
+            self.counts = bytearray(6 * GameState.NUM_HEXES)
+            self.totals = [0] * 6
+            self.stacks_key = 0
+            if friends is not None:
+                self.__load_side(friends, is_friend=True)
+            if enemies is not None:
+                self.__load_side(enemies, is_friend=False)
+        else:
+            self.boards = boards
+            self.counts = counts
+            self.totals = totals if totals is not None else [sum(counts[plane::6]) for plane in range(6)]
+            self.stacks_key = stacks_key if stacks_key is not None else stacks_key_from(counts)
         if existing_moves is None:
+            # Like the referee, the starting position counts as its first occurrence
             self.existing_moves = ExistingMoves()
+            self.existing_moves.add_game_state(self)
         else:
             self.existing_moves = existing_moves
         self.pruning_is_aggressive = pruning_is_aggressive
         self.branching = prev_branching
 
+    @staticmethod
+    def encode_move(transition):
+        """ packs a referee move tuple into the int move format used by the game state."""
+        return moves.encode_move(transition, GameState.hex_index)
+
+    @staticmethod
+    def decode_move(packed_move):
+        """ unpacks an int move into the referee move tuple format."""
+        return moves.decode_move(packed_move, GameState.hexes)
+
     def update(self, friend_transition=None, enemy_transition=None):
-        """ applies moves from both players to the game state, progressing the game one turn."""
+        """ 
+        applies moves from both players to the game state, progressing the game one turn. Moves are
+        packed ints, see state.move
+        """
         self.turn += 1
-        self.__apply_move(friend_transition, True)
-        self.__apply_move(enemy_transition, False)
-        if friend_transition is not None:
-            self.__battle(friend_transition[2])  # index 2 is the destination of the move
-            if enemy_transition is not None and friend_transition[2] != enemy_transition[2]:
-                self.__battle(enemy_transition[2]) # in the case friend and enemy don't move to the same location
-        elif enemy_transition is not None:
-            self.__battle(enemy_transition[2])
+        friend_destination = self.__apply_move(friend_transition, True)
+        enemy_destination = self.__apply_move(enemy_transition, False)
+        if friend_destination is not None:
+            self.__battle(friend_destination)
+            if enemy_destination is not None and friend_destination != enemy_destination:
+                self.__battle(enemy_destination) # in the case friend and enemy don't move to the same location
+        elif enemy_destination is not None:
+            self.__battle(enemy_destination)
         self.existing_moves.add_game_state(self)
+        self.goal = GameState.GOAL_UNKNOWN
 
         if (self.friend_throws == 9) or (self.enemy_throws == 9):
             self.phase = Phase.LATE
         elif self.turn > 4:
             self.phase = Phase.MIDDLE
 
+    def apply(self, friend_transition=None, enemy_transition=None):
+        """
+        Apply moves from both players in place, like update, and return an undo token.
+
+        The token records everything the update can change: the tokens on the hexes involved in
+        the moves (including any defeated in battles), the throw counters, the turn and the entry
+        added to the repeated state history. Passing it to undo restores the state exactly, which
+        lets search code evaluate children without copying the state.
+        """
+        counts = self.counts
+        touched = []
+        for transition in (friend_transition, enemy_transition):
+            if transition is None:
+                continue
+            # throws only change the destination, slides and swings also change the origin
+            start = (transition >> DESTINATION_SHIFT) * 6
+            touched.append((start, counts[start:start + 6]))
+            if transition & 3 != THROW:
+                start = (transition >> ORIGIN_SHIFT & INDEX_MASK) * 6
+                touched.append((start, counts[start:start + 6]))
+        existing_moves = self.existing_moves
+        token = (
+            self.boards[:], touched, self.totals[:], self.friend_throws, self.enemy_throws, self.turn,
+            self.phase, self.stacks_key, existing_moves.limit_is_close, existing_moves.limit_reached,
+            self.goal
+        )
+        self.update(friend_transition, enemy_transition)
+        return token
+
+    def undo(self, token):
+        """
+        Revert the update made by the apply call that returned token. Calls must be undone in the
+        reverse order that they were applied.
+        """
+        (boards, touched, totals, friend_throws, enemy_throws, turn, phase,
+            stacks_key, limit_is_close, limit_reached, goal) = token
+        # The history entry is found from the key of the applied state, so remove it first
+        self.existing_moves.remove_game_state(self, limit_is_close, limit_reached)
+        self.friend_throws = friend_throws
+        self.enemy_throws = enemy_throws
+        self.turn = turn
+        self.phase = phase
+        self.boards = boards
+        self.totals = totals
+        for start, stack_counts in touched:
+            self.counts[start:start + 6] = stack_counts
+        self.stacks_key = stacks_key
+        self.goal = goal
+
     def copy(self) -> "GameState":
         new_game_state = GameState(
             self.is_upper, 
             self.turn, 
             self.friend_throws, 
             self.enemy_throws,
-            self.friends.copy(), 
-            self.enemies.copy(), 
+            None,
+            None,
             self.existing_moves.copy(), 
             self.pruning_is_aggressive, 
-            self.branching
+            self.branching,
+            self.boards[:],
+            self.counts[:],
+            self.stacks_key,
+            self.totals[:]
         )
         return new_game_state
 
+    @property
+    def friends(self):
+        """
+        Friend tokens as a dict of type {(r, q): [token, ...]}. 
+        
+        This is a snapshot built from the bitboards, changes made to the returned dict are not 
+        written back to the game state. Assign a new dict instead.
+        """
+        return self.__side_dict(is_friend=True)
+
+    @friends.setter
+    def friends(self, stacks):
+        self.__load_side(stacks, is_friend=True)
+
+    @property
+    def enemies(self):
+        """
+        Enemy tokens as a dict of type {(r, q): [token, ...]}, see friends.
+        """
+        return self.__side_dict(is_friend=False)
+
+    @enemies.setter
+    def enemies(self, stacks):
+        self.__load_side(stacks, is_friend=False)
+
+    def __side_dict(self, is_friend):
+        """ builds a {(r, q): [token, ...]} dict for one side from the bitboards."""
+        base = 0 if is_friend else 3
+        stacks = {}
+        for i in iter_bits(self.occupied(is_friend)):
+            tokens = []
+            for plane in range(base, base + 3):
+                tokens += [SYMBOLS[plane - base]] * self.counts[i * 6 + plane]
+            stacks[GameState.hexes[i]] = tokens
+        return stacks
+
+    def __load_side(self, stacks, is_friend):
+        """ replaces all tokens of one side with those in a {(r, q): [token, ...]} dict."""
+        base = 0 if is_friend else 3
+        self.goal = GameState.GOAL_UNKNOWN
+        for plane in range(base, base + 3):
+            self.boards[plane] = 0
+        for plane in range(base, base + 3):
+            self.counts[plane::6] = bytes(GameState.NUM_HEXES)
+            self.totals[plane] = 0
+        self.stacks_key = stacks_key_from(self.counts)
+        for loc, tokens in stacks.items():
+            for token in tokens:
+                self.__push(base + SYMBOL_INDEX[token], GameState.hex_index[loc])
+
+    @property
+    def key(self):
+        """
+        64 bit Zobrist key of the position: the tokens of each symbol for each side on every hex and 
+        the number of throws used by each side. Matches the referee's repeated state rule.
+        """
+        return self.stacks_key ^ THROW_KEYS[0][self.friend_throws] ^ THROW_KEYS[1][self.enemy_throws]
+
+    def distance_field(self, plane):
+        """
+        Distance field of the tokens of a (side, symbol) plane. The field is a tuple of bitmasks, 
+        entry d holds every hex that is within distance d of the nearest such token. Use 
+        field_distance to read the distance for a single hex.
+
+        A field only depends on the plane's bitmask, so fields are memoised in move_cache rather
+        than stored on each state.
+        """
+        mask = self.boards[plane]
+        key = ('field', mask)
+        field = GameState.move_cache.get(key)
+        if field is None:
+            field = (0,) * (GameState.board.max_distance + 1)
+            for i in iter_bits(mask):
+                field = tuple([w | b for w, b in zip(field, GameState.board.distance_balls[i])])
+            GameState.move_cache.put(key, field)
+        return field
+
+    @staticmethod
+    def field_distance(field, i):
+        """
+        Distance from the hex with index i to the nearest token of a distance field, or 
+        NO_TOKEN_DISTANCE if the field has no tokens.
+        """
+        bit = 1 << i
+        for d, within in enumerate(field):
+            if within & bit:
+                return d
+        return GameState.NO_TOKEN_DISTANCE
+
+    def occupied(self, is_friend):
+        """ bitmask of all hexes holding at least one token of a side."""
+        if is_friend:
+            return self.boards[0] | self.boards[1] | self.boards[2]
+        return self.boards[3] | self.boards[4] | self.boards[5]
+
+    def symbol_masks(self, is_friend):
+        """ bitmasks of the hexes holding r, p and s tokens of a side."""
+        return self.boards[0:3] if is_friend else self.boards[3:6]
+
+    def symbol_presence(self, is_friend):
+        """ bitmask of the symbol codes a side has on the board, bit i is set if it has symbol i."""
+        totals = self.totals[0:3] if is_friend else self.totals[3:6]
+        return (totals[0] > 0) | (totals[1] > 0) << 1 | (totals[2] > 0) << 2
+
+    def symbol_counts(self, is_friend):
+        """ number of r, p and s tokens a side has on the board."""
+        return self.totals[0:3] if is_friend else self.totals[3:6]
+
+    def count_at(self, plane, i):
+        """ number of tokens of a (side, symbol) plane on the hex with index i."""
+        return self.counts[i * 6 + plane]
+
+    def stack_size(self, is_friend, i):
+        """ number of tokens of a side on the hex with index i."""
+        i = i * 6 + (0 if is_friend else 3)
+        return self.counts[i] + self.counts[i + 1] + self.counts[i + 2]
+
+    def symbol_at(self, is_friend, i):
+        """ symbol code of the tokens of a side on the hex with index i, or None if it is empty."""
+        base = 0 if is_friend else 3
+        bit = 1 << i
+        for plane in range(base, base + 3):
+            if self.boards[plane] & bit:
+                return plane - base
+        return None
+
     def num_friends(self):
         return self.num_in_play_for_side(is_friend=True)
     
@@ -101,11 +353,10 @@ class GameState:
         return self.num_in_play_for_side(is_friend=False)
 
     def num_in_play_for_side(self, is_friend):
-        reference = self.friends if is_friend else self.enemies
-        count = 0
-        for tokens in reference.values():
-            count += len(tokens)
-        return count
+        totals = self.totals
+        if is_friend:
+            return totals[0] + totals[1] + totals[2]
+        return totals[3] + totals[4] + totals[5]
 
     def num_deaths(self):
         return self.friend_throws - self.num_friends()
@@ -114,8 +365,11 @@ class GameState:
         return self.enemy_throws - self.num_enemies()
 
     def next_transitions(self):
-        """ all possible permutations of next moves from the game state."""
-        return list(product(self.next_transitions_for_side(True), self.next_transitions_for_side(False)))
+        """ 
+        all possible permutations of next moves from the game state. The (friend, enemy) pairs are 
+        produced lazily, iterate over the result rather than indexing it.
+        """
+        return product(self.next_transitions_for_side(True), self.next_transitions_for_side(False))
 
     def next_friend_transitions(self):
         return self.next_transitions_for_side(is_friend=True)
@@ -125,211 +379,172 @@ class GameState:
 
     def next_transitions_for_side(self, is_friend):
         """ all possible moves for one side from the current game state."""
-        return self.next_slide_transitions(is_friend) + self.next_swing_transitions(is_friend) + self.next_throw_transitions(is_friend)
+        return list(self.__cached_moves(is_friend) + self.__pruned_throws(is_friend))
 
     def next_swing_slide_transitions(self, is_friend):
-        return self.next_slide_transitions(is_friend) + self.next_swing_transitions(is_friend)
+        return list(self.__cached_moves(is_friend))
 
-    def __apply_move(self, move, is_friend):
-        """ makes the move for a given side on the current game state."""
-        if move is not None:
-            reference = self.friends if is_friend else self.enemies
-            if move[0] == 'THROW':
-                # move indexes are move type, token, location
-                reference[move[2]] = reference[move[2]] + [move[1]] if move[2] in reference else [move[1]]  # add token to location
-                if is_friend: self.friend_throws += 1
-                else: self.enemy_throws += 1
-
-            else:
-                # move indexes are move type, start location, end location
-                token = GameState.__pop(reference, move[1])
-                reference[move[2]] = reference[move[2]] + [token] if move[2] in reference else [token]  # add token to location
-                
+    def __cached_moves(self, is_friend):
+        """
+        The slides and swings of a side as a tuple, memoised in move_cache. They only depend on 
+        the hexes the side occupies.
+        """
+        occupied = self.occupied(is_friend)
+        key = ('moves', occupied)
+        moves = GameState.move_cache.get(key)
+        if moves is None:
+            moves = tuple(chain(self.iter_slide_transitions(is_friend), self.iter_swing_transitions(is_friend)))
+            GameState.move_cache.put(key, moves)
+        return moves
+
+    def __pruned_throws(self, is_friend):
+        """
+        The throws of a side that survive pruning, as a tuple. See ThrowPlans for the pruning
+        rules. When opponents are near the throw zone the kept throws depend on where they are,
+        these are memoised in move_cache by the opponent tokens.
+        """
+        throw_count = self.friend_throws if is_friend else self.enemy_throws
+        if throw_count >= GameState.MAX_THROWS: return () # no more throw moves are allowed
+        upper = (self.is_upper and is_friend) or ((not self.is_upper) and (not is_friend))
+        opponents = self.symbol_masks(not is_friend)
+        nearest_opponent_r = GameState.nearest_row(opponents[0] | opponents[1] | opponents[2], upper)
+        distant_throws, zone_mask, max_throw_enemy_distance = GameState.throw_plans.plan(
+            upper, throw_count, nearest_opponent_r, self.pruning_is_aggressive)
+        if distant_throws is not None:
+            return distant_throws
+
+        key = ('throws', zone_mask, max_throw_enemy_distance, *opponents)
+        throws = GameState.move_cache.get(key)
+        if throws is None:
+            # Hexes of the zone within range of an opponent that each symbol can defeat
+            opponent_base = 3 if is_friend else 0
+            in_range = [
+                self.distance_field(opponent_base + DEFEATS[symbol])[max_throw_enemy_distance] & zone_mask
+                for symbol in range(3)
+            ]
+            throws = []
+            for throw_i in iter_bits(in_range[0] | in_range[1] | in_range[2]):
+                bit = 1 << throw_i
+                for symbol in range(3):
+                    if in_range[symbol] & bit:
+                        throws.append(pack_move(THROW, 0, throw_i, symbol))
+            throws = tuple(throws)
+            GameState.move_cache.put(key, throws)
+        return throws
 
-    def __pop(target_dict, location):
+    def __apply_move(self, move, is_friend):
         """
-        Pop an element from target_dict at location in a way that overwrites the original list
-        (this prevents shallow copy issues)
+        makes the move for a given side on the current game state. Returns the index of the 
+        destination hex, or None if there is no move.
         """
-        removed = target_dict[location][0]
-        target_dict[location] = target_dict[location][1:]
-        if len(target_dict[location]) == 0:
-            del target_dict[location]
-        return removed
+        if move is None:
+            return None
+        base = 0 if is_friend else 3
+        destination = move >> DESTINATION_SHIFT
+        if move & 3 == THROW:
+            self.__push(base + move_symbol(move), destination)
+            if is_friend: self.friend_throws += 1
+            else: self.enemy_throws += 1
+
+        else:
+            origin = move >> ORIGIN_SHIFT & INDEX_MASK
+            plane = base + self.symbol_at(is_friend, origin)
+            self.__pop(plane, origin)
+            self.__push(plane, destination)
+        return destination
+
+    def __push(self, plane, i):
+        """ adds a token of the given (side, symbol) plane to the hex with index i."""
+        index = i * 6 + plane
+        count = self.counts[index]
+        self.stacks_key ^= STACK_KEYS[index][count] ^ STACK_KEYS[index][count + 1]
+        self.counts[index] = count + 1
+        self.totals[plane] += 1
+        self.boards[plane] |= 1 << i
+
+    def __pop(self, plane, i):
+        """ removes a token of the given (side, symbol) plane from the hex with index i."""
+        index = i * 6 + plane
+        count = self.counts[index]
+        self.stacks_key ^= STACK_KEYS[index][count] ^ STACK_KEYS[index][count - 1]
+        self.counts[index] = count - 1
+        self.totals[plane] -= 1
+        if count == 1:
+            self.boards[plane] &= ~(1 << i)
 
 
     def next_slide_transitions(self, is_friend):
         """ calculates all slide transitions for a side."""
-        transitions = []
-        reference = self.friends if is_friend else self.enemies
-        for loc in reference.keys():
-            for new_loc in GameState.board.get_slide_options(loc):
-                transitions.append(("SLIDE", loc, new_loc))
-        return transitions
+        return list(self.iter_slide_transitions(is_friend))
 
     def next_swing_transitions(self, is_friend):
         """ calculates all swing transitions for a side."""
-        transitions = []
-        reference = self.friends if is_friend else self.enemies
-        for loc in reference.keys():
-            possible_pivots = GameState.board.get_slide_options(loc)
-            for pivot in possible_pivots:
-                if pivot in reference:  # there exists an ally that can be used for a swing
-                    for new_loc in GameState.board.get_swing_options(loc, pivot):
-                        transitions.append(("SWING", loc, new_loc))    
-
-        return transitions
+        return list(self.iter_swing_transitions(is_friend))
 
     def next_throw_transitions(self, is_friend):
         """ calculates all throw transitions for a side."""
-        transitions = []
-        throw_count = self.friend_throws if is_friend else self.enemy_throws
-        if throw_count >= GameState.MAX_THROWS: return transitions # no more throw moves are allowed
-        
-        upper = (self.is_upper and is_friend) or ((not self.is_upper) and (not is_friend))
-        for loc in GameState.board.get_throw_options(upper, throw_count):
-            # any kind of pruning logic for throws should be imported and run here.
-            for tok in ['r', 'p', 's']:
-                transitions.append(('THROW', tok, loc))
-        
-        return self.__prune_throws(transitions, is_friend)
+        return list(self.iter_throw_transitions(is_friend))
+
+    def iter_slide_transitions(self, is_friend):
+        slide_moves = GameState.board.slide_moves
+        return chain.from_iterable([slide_moves[i] for i in iter_bits(self.occupied(is_friend))])
+
+    def iter_swing_transitions(self, is_friend):
+        return chain.from_iterable(self.__swing_move_groups(is_friend))
+
+    def __swing_move_groups(self, is_friend):
+        """ the tuples of swing moves for each pair of adjacent allies of a side."""
+        slide_masks = GameState.board.slide_masks
+        swing_moves = GameState.board.swing_moves
+        occupied = self.occupied(is_friend)
+        groups = []
+        for i in iter_bits(occupied):
+            row_start = i * GameState.NUM_HEXES
+            # adjacent allies that can be used for a swing
+            for pivot in iter_bits(slide_masks[i] & occupied):
+                groups.append(swing_moves[row_start + pivot])
+        return groups
+
+    def iter_throw_transitions(self, is_friend):
+        return iter(self.__pruned_throws(is_friend))
 
-    def __prune_throws(self, throws, is_friend):
+    @staticmethod
+    def nearest_row(mask, is_upper):
         """
-        Prune throws that seem very unlikely to improve the score.
-
-        If enemies aren't within 2 units of the farthest throw row, the throws only the throws up 
-        to the farthest throw row are kept, otherwise only throws that throw a token to within 2
-        units of a killable opponent are kept
-
+        The row of the hexes in mask nearest to the upper side's start (the highest row) if 
+        is_upper, otherwise the lowest row. Defaults to the opposite side's start row if mask is
+        empty. Hex indices are in row order, so this only needs the highest or lowest set bit.
         """
-
-
-
-
-        # Enemies to the current throw side
-        opponents = self.enemies if is_friend else self.friends
-        pruned_throws = []
-
-        # Set num tokens used
-        if is_friend:
-            num_tokens_used = self.friend_throws
-        else:
-            num_tokens_used = self.enemy_throws
-
-        # Set is_upper
-        if (is_friend and self.is_upper) or (not is_friend and not self.is_upper):
-            is_upper = True
-        else:
-            is_upper = False
-        
-        # Set farthest rows for each side
-        farthest_r, nearest_opponent_r = GameState.farthest_rows(num_tokens_used, is_upper, opponents)
-
-        # Set the max distance away from an opponent token that a throw can be made to
-        if self.pruning_is_aggressive:
-            max_throw_enemy_distance = GameState.MAX_THROW_ENEMY_DISTANCE_AGGRESSIVE
-        else:
-            max_throw_enemy_distance = GameState.MAX_THROW_ENEMY_DISTANCE
-
-        # Adjust max throw distance in case that the enemy is close but not past the 
-        # max throw distance line
-        if (is_upper and nearest_opponent_r < farthest_r and nearest_opponent_r >= farthest_r - GameState.MAX_THROW_ENEMY_DISTANCE) \
-            or ((not is_upper) and nearest_opponent_r > farthest_r and nearest_opponent_r <= farthest_r + GameState.MAX_THROW_ENEMY_DISTANCE):
-            max_throw_enemy_distance = abs(nearest_opponent_r - farthest_r)
-
-
-        pruned_throws += GameState.__append_throws_distant(
-            throws, farthest_r, nearest_opponent_r, is_upper, self.pruning_is_aggressive)
-
-        # Append throws that are near opponents if opponent in range
-        if len(pruned_throws) == 0:
-            # There are opposing tokens less than MAX_DISTANCE away, add all throws within
-            # MAX_THROW_ENEMY_DISTANCE of an enemy only.
-            for throw in throws:
-                (_, throw_token, throw_loc) = throw
-                for enemy_loc, enemy_tokens, in opponents.items():
-                    if (distance(throw_loc, enemy_loc) <= max_throw_enemy_distance
-                            and enemy_tokens[0] == defeat_token(throw_token)):
-                        pruned_throws.append(throw)
-                        break
-
-        return pruned_throws
-
-    @staticmethod
-    def farthest_rows(num_tokens_used, is_upper, opponents):
-        farthest_r = GameState.farthest_r(num_tokens_used, is_upper)
-        nearest_throw_enemy_r = -4 if is_upper else 4
-
-        # Find row of nearest enemy row
-        for (r, _) in opponents.keys():
-            if (is_upper and r > nearest_throw_enemy_r) or (not is_upper and r < nearest_throw_enemy_r):
-                nearest_throw_enemy_r = r
-        
-        return farthest_r, nearest_throw_enemy_r
-
-
-    @staticmethod
-    def __append_throws_distant(throws, farthest_r, nearest_opponent_r, is_upper, is_aggressive=False):
-        """
-        Return a list of throws to the farthest reachable row only if no enemy is closer, otherwise
-        return an empty list.
-
-        """
-
-        # farthest_r = GameState.farthest_r(num_tokens_used, is_upper)
-        # nearest_throw_enemy_r = -4 if is_upper else 4
-        max_throw_enemy_distance = GameState.MAX_THROW_ENEMY_DISTANCE
-
-        # # Find row of nearest enemy row
-        # for (r, _) in throw_enemies.keys():
-        #     if (is_upper and r > nearest_throw_enemy_r) or (not is_upper and r < nearest_throw_enemy_r):
-        #         nearest_throw_enemy_r = r
-
-        # Make pruned_throws all throws to the farthest reachable row only if the closest enemy
-        # is further than that, otherwise make it empty
-        # if abs(farthest_r - nearest_throw_enemy_r) > GameState.MAX_THROW_ENEMY_DISTANCE:
-        pruned_throws = []
-        if (is_upper and (nearest_opponent_r < farthest_r - max_throw_enemy_distance )) or \
-            ((not is_upper) and (nearest_opponent_r > farthest_r + max_throw_enemy_distance)):
-            if is_aggressive:
-                pruned_throws = [
-                    ("THROW", token, loc)
-                        for token in ['r','p','s']
-                        for loc in GameState.distant_throw_options[farthest_r]
-                    ]
-            else:
-                for throw in throws:
-                    (_, _, (throw_r, _)) = throw
-                    if throw_r == farthest_r:
-                        pruned_throws.append(throw)
-        return pruned_throws
-
-    def __battle(self, location):
-        """ checks for balles in the locations that have changed from the prior game state."""
-        tokens = set(self.friends.get(location, []) + self.enemies.get(location, []))
-        if len(tokens) == 1:
-            return # there is only 1 type of token at the location, so no battles
-        if len(tokens) == 3:
-            # there can only be 3 types of tokens if both sides move tokens to the location
-            del self.friends[location] # if every type of token exists, they all are defeated
-            del self.enemies[location]
+        if mask == 0:
+            return -4 if is_upper else 4
+        if is_upper:
+            return GameState.board.rows[mask.bit_length() - 1]
+        return GameState.board.rows[(mask & -mask).bit_length() - 1]
+
+    def __battle(self, i):
+        """ checks for balles in the locations (given by hex index) that have changed from the prior game state."""
+        counts = self.counts
+        start = i * 6
+        # bitmask of the symbols on the hex from either side
+        present = (
+            (1 if counts[start] or counts[start + 3] else 0)
+            | (2 if counts[start + 1] or counts[start + 4] else 0)
+            | (4 if counts[start + 2] or counts[start + 5] else 0)
+        )
+        for defeated in BATTLE_DEFEATED[present]:
+            self.__clear_defeated(defeated, i)
+            self.__clear_defeated(defeated + 3, i)
+
+    def __clear_defeated(self, plane, i):
+        """ removes all tokens of a (side, symbol) plane from the hex with index i."""
+        index = i * 6 + plane
+        count = self.counts[index]
+        if count == 0:
             return
-        
-        if tokens == {'r', 's'}: defeated = 's'  # the scissors is defeated by the rock
-        elif tokens == {'s', 'p'}: defeated = 'p'
-        elif tokens == {'p', 'r'}: defeated = 'r'
-
-        if location in self.friends: self.__clear_defeated(location, defeated, True)
-        if location in self.enemies: self.__clear_defeated(location, defeated, False)
-        return
-
-    def __clear_defeated(self, location, defeated, is_friend):
-        """ removes specific tokens from a given location and for a given side."""
-        reference = self.friends if is_friend else self.enemies
-        reference[location] = [tok for tok in reference[location] if tok != defeated]  # remove defeated
-        if len(reference[location]) == 0:  # remove location reference if no more tokens are on location
-            del reference[location]
+        self.stacks_key ^= STACK_KEYS[index][count]
+        self.totals[plane] -= count
+        self.counts[index] = 0
+        self.boards[plane] &= ~(1 << i)
 
     @staticmethod
     def farthest_r(num_tokens_used, is_upper):
@@ -342,23 +557,31 @@ class GameState:
         else:
             return min(-4 + num_tokens_used, 4)
 
-    def moves_to_pieces(self, swing_slide_transitions, is_friend):
+    def move_reach(self, is_friend):
         """
-        Convert a list of move commands of type: (type, from_loc, to_loc) to a list of pieces of
-        type: (token, to_loc).
+        Bitmasks of the hexes that tokens of a side can reach with a single slide or swing, one
+        for each symbol, of type: (r_mask, p_mask, s_mask). Memoised in move_cache.
         """
-        reference = self.friends if is_friend else self.enemies
-        return_pieces = {}
-        for (_, from_loc, to_loc) in swing_slide_transitions:
-            for piece_loc, tokens in reference.items():
-                if from_loc == piece_loc:
-                    try:
-                        return_pieces[to_loc].add(tokens[0])
-                    except:
-                        return_pieces[to_loc] = {tokens[0]}
-                    # return_pieces.append((tokens[0], to_loc))
-        return return_pieces
-
+        symbol_masks = self.symbol_masks(is_friend)
+        key = ('reach', *symbol_masks)
+        reach = GameState.move_cache.get(key)
+        if reach is not None:
+            return reach
+        slide_masks = GameState.board.slide_masks
+        swing_masks = GameState.board.swing_masks
+        occupied = symbol_masks[0] | symbol_masks[1] | symbol_masks[2]
+        reach = [0, 0, 0]
+        for symbol, symbol_mask in enumerate(symbol_masks):
+            for i in iter_bits(symbol_mask):
+                slide = slide_masks[i]
+                symbol_reach = slide
+                row_start = i * GameState.NUM_HEXES
+                for pivot in iter_bits(slide & occupied):
+                    symbol_reach |= swing_masks[row_start + pivot]
+                reach[symbol] |= symbol_reach
+        reach = tuple(reach)
+        GameState.move_cache.put(key, reach)
+        return reach
 
     def __str__(self):
         return f"Upper: {self.friends.__str__()}\nLower: {self.enemies.__str__()}\nTurn: {self.turn}\n"
@@ -367,7 +590,7 @@ class GameState:
         return self.__str__()
 
     def __hash__(self):
-        return (f"{self.friends.__str__()}").__hash__()
+        return self.key
 
 
 if __name__ == '__main__':
@@ -380,39 +603,118 @@ if __name__ == '__main__':
     move_5 = ('SLIDE', (-4,1), (-3,1))
     move_6 = ('SWING', (-3,1), (-1,1))
 
-    g.update(move_1, move_4)
-    g.update(move_2, move_5)
+    g.update(GameState.encode_move(move_1), GameState.encode_move(move_4))
+    g.update(GameState.encode_move(move_2), GameState.encode_move(move_5))
 
     g.next_transitions_for_side(True)
     # g.friend_throws = 9
     # g.next_transitions_for_side(True)
 
 
+class HistoryNode:
+    """
+    A frozen part of the repeated state history: the occurrence counts that changed since the
+    parent node was frozen. Nodes are never modified once frozen, so they can be shared by any
+    number of histories.
+    """
+
+    __slots__ = ('counts', 'parent', 'depth')
+
+    def __init__(self, counts, parent=None):
+        self.counts = counts
+        self.parent = parent
+        self.depth = 1 if parent is None else parent.depth + 1
+
+    def count(self, hash):
+        node = self
+        while node is not None:
+            count = node.counts.get(hash)
+            if count is not None:
+                return count
+            node = node.parent
+        return 0
+
+    def flatten(self):
+        """ a single node holding the latest count of every state in the chain."""
+        chain = []
+        node = self
+        while node is not None:
+            chain.append(node.counts)
+            node = node.parent
+        counts = {}
+        for node_counts in reversed(chain):
+            counts.update(node_counts)
+        return HistoryNode({hash: count for hash, count in counts.items() if count > 0})
+
+
 class ExistingMoves:
+    """
+    Counts how many times each state (by Zobrist key) has occurred.
 
-    def __init__(self, existing=None, limit_reached=False):
-        if existing is None:
-            self.existing = {}
-        else:
-            self.existing = existing
-        
+    The history is persistent: counts added since the last copy are kept in a small local dict, 
+    and older counts live in a chain of frozen HistoryNodes shared with the copies made from
+    this history and its ancestors. Copying freezes the local dict onto the chain, so it takes 
+    constant time and memory rather than copying every state of the game. The chain is flattened
+    once it gets longer than MAX_HISTORY_DEPTH so lookups stay cheap.
+    """
+
+    __slots__ = ('local', 'history', 'limit_is_close', 'limit_reached')
+
+    MAX_HISTORY_DEPTH = 16
+
+    def __init__(self, existing=None, limit_reached=False, history=None):
+        self.local = {} if existing is None else dict(existing)
+        self.history = history
         self.limit_is_close = 0
         self.limit_reached = limit_reached
 
+    def count(self, hash):
+        """ the number of times the state with the given key has occurred."""
+        count = self.local.get(hash)
+        if count is not None:
+            return count
+        return 0 if self.history is None else self.history.count(hash)
+
     def add_game_state(self, game_state: GameState):
 
-        hash = game_state.__hash__()
-        if hash in self.existing:
-            self.existing[hash] += 1
-            if self.existing[hash] >= MAX_REPEATED_MOVES - 1:
-                self.limit_is_close = True
-            if self.existing[hash] >= MAX_REPEATED_MOVES:
-                self.limit_reached = True
-        else:
-            self.existing[hash] = 1
+        hash = game_state.key
+        count = self.count(hash) + 1
+        self.local[hash] = count
+        if count >= MAX_REPEATED_MOVES - 1:
+            self.limit_is_close = True
+        if count >= MAX_REPEATED_MOVES:
+            self.limit_reached = True
             
+    def remove_game_state(self, game_state: GameState, limit_is_close, limit_reached):
+        """
+        Remove one occurrence of the game state, restoring the limit flags to what they were
+        before it was added.
+        """
+        hash = game_state.key
+        count = self.count(hash) - 1
+        if self.history is not None and self.history.count(hash) == count:
+            del self.local[hash] # back to the frozen count
+        elif count == 0 and self.history is None:
+            del self.local[hash]
+        else:
+            self.local[hash] = count
+        self.limit_is_close = limit_is_close
+        self.limit_reached = limit_reached
+
     def copy(self):
-        return ExistingMoves(self.existing.copy(), self.limit_reached) 
+        if self.local:
+            # freeze the local counts so both histories can share them
+            self.history = HistoryNode(self.local, self.history)
+            if self.history.depth > ExistingMoves.MAX_HISTORY_DEPTH:
+                self.history = self.history.flatten()
+            self.local = {}
+        return ExistingMoves(limit_reached=self.limit_reached, history=self.history)
+
+    def counts(self):
+        """ a dict of the number of occurrences of every state that has occurred."""
+        counts = {} if self.history is None else dict(self.history.flatten().counts)
+        counts.update(self.local)
+        return {hash: count for hash, count in counts.items() if count > 0}
 
     def __repr__(self):
-        return str(self.existing)
+        return str(self.counts())
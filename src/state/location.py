@@ -14,6 +14,13 @@ def distance(loc_a, loc_b):
         abs(loc_a[1] - loc_b[1]) + 
         abs(-loc_a[1] - loc_a[0] + loc_b[1] + loc_b[0])) / 2
 
+def distance_table(locations):
+    """
+    Precompute the integer distance between every pair of locations. Returns a flat tuple indexed 
+    by i * len(locations) + j for the locations at index i and j.
+    """
+    return tuple(int(distance(loc_a, loc_b)) for loc_a in locations for loc_b in locations)
+
 def loc_add(loc_a, loc_b):
     return (loc_a[0] + loc_b[0], loc_a[1] + loc_b[1])
 
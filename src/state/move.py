@@ -0,0 +1,83 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+"""
+Moves are packed into a single int so they are cheap to store, compare and hash.
+
+    bits 0-1    move type (SLIDE, SWING or THROW)
+    bits 2-3    symbol code of the thrown token, 0 for slides and swings
+    bits 4-9    origin hex index, 0 for throws
+    bits 10-15  destination hex index
+
+Moves are converted to and from the referee's tuple format with encode_move and decode_move,
+which should only be needed where moves are passed to or received from the referee.
+"""
+
+from state.token import SYMBOLS, SYMBOL_INDEX
+
+SLIDE = 0
+SWING = 1
+THROW = 2
+MOVE_NAMES = ('SLIDE', 'SWING', 'THROW')
+MOVE_TYPES = {name: move_type for move_type, name in enumerate(MOVE_NAMES)}
+
+SYMBOL_SHIFT = 2
+ORIGIN_SHIFT = 4
+DESTINATION_SHIFT = 10
+INDEX_MASK = 63
+
+
+def pack_move(move_type, origin, destination, symbol=0):
+    """
+    Return the packed move for a move type, origin and destination hex index and thrown symbol code
+    """
+    return move_type | symbol << SYMBOL_SHIFT | origin << ORIGIN_SHIFT | destination << DESTINATION_SHIFT
+
+
+def move_type(move):
+    return move & 3
+
+
+def move_symbol(move):
+    return move >> SYMBOL_SHIFT & 3
+
+
+def move_origin(move):
+    return move >> ORIGIN_SHIFT & INDEX_MASK
+
+
+def move_destination(move):
+    return move >> DESTINATION_SHIFT
+
+
+def encode_move(transition, hex_index):
+    """
+    Pack a referee move tuple, like ('SLIDE', (r, q), (r, q)) or ('THROW', 's', (r, q)).
+    hex_index maps board locations to hex indices. None is passed through unchanged.
+    """
+    if transition is None:
+        return None
+    move_type = MOVE_TYPES[transition[0]]
+    destination = hex_index[transition[2]]
+    if move_type == THROW:
+        return pack_move(THROW, 0, destination, SYMBOL_INDEX[transition[1]])
+    return pack_move(move_type, hex_index[transition[1]], destination)
+
+
+def decode_move(move, hexes):
+    """
+    Unpack a move into the referee's tuple format. hexes maps hex indices to board locations.
+    None is passed through unchanged.
+    """
+    if move is None:
+        return None
+    move_type = move & 3
+    destination = hexes[move >> DESTINATION_SHIFT]
+    if move_type == THROW:
+        return (MOVE_NAMES[THROW], SYMBOLS[move >> SYMBOL_SHIFT & 3], destination)
+    return (MOVE_NAMES[move_type], hexes[move >> ORIGIN_SHIFT & INDEX_MASK], destination)
@@ -0,0 +1,59 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+from collections import OrderedDict
+
+
+class MoveCache:
+    """
+    Bounded least recently used cache for move generation results.
+
+    The moves of a side only depend on a few parts of the game state (the hexes it occupies, its
+    throw count and for throws the opponent tokens), so sibling nodes in a search tree usually
+    generate identical moves. Keys are built from exactly those parts, values should be tuples so
+    that callers can't change a cached result.
+    """
+
+    __slots__ = ('max_size', 'entries', 'hits', 'misses')
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if it isn't cached
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                # Evicted by a search in another thread since it was read
+                pass
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"MoveCache(size={len(self.entries)}/{self.max_size}, hits={self.hits}, misses={self.misses})"
@@ -10,6 +10,9 @@ from state.game_state import GameState
 
 
 class Node(GameState):
+
+    __slots__ = ('action', 'parent', 'children', 'is_friend', 'is_fully_expanded', 'q_value', 'num_visits')
+
     def __init__(
         self, 
         other: GameState, 
@@ -32,8 +35,10 @@ class Node(GameState):
             turn=other.turn,
             friend_throws = other.friend_throws,
             enemy_throws = other.enemy_throws,
-            friends = other.friends,
-            enemies = other.enemies,
+            boards = other.boards,
+            counts = other.counts,
+            stacks_key = other.stacks_key,
+            totals = other.totals,
         )
 
         # Extra attributes
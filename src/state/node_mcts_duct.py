@@ -7,20 +7,32 @@ Kevin Russell 1084088
 """
 
 from state.game_state import GameState
-from time import time
 
 class Node(GameState):
+    """
+    A DUCT tree node, a game state with the statistics of its matrix of children.
+
+    A Node takes over the boards, counts, totals and repeated state history of the game state it
+    is made from instead of copying them, so that state must not be changed afterwards. Make the
+    Node from a copy (as copy_node_state does) if the original is still in use.
+    """
+
+    __slots__ = (
+        'parent', 'friend_transitions', 'enemy_transitions', 'matrix', 'q_value',
+        'num_visits', 'i', 'j', 'row_visits', 'row_scores', 'col_visits', 'col_scores'
+    )
+
     def __init__(
             self, 
             other: GameState,
             parent=None,
-            is_fully_expanded=False,
             friend_transitions=None,
             enemy_transitions=None,
             matrix=None,
             q_value=0,
             num_visits=0,
-            evaluation_score=0,
+            i=-1,
+            j=-1,
         ):
 
         """
@@ -31,8 +43,10 @@ class Node(GameState):
         """
         super().__init__(
             is_upper = other.is_upper,
-            friends = other.friends,
-            enemies = other.enemies,
+            boards = other.boards,
+            counts = other.counts,
+            stacks_key = other.stacks_key,
+            totals = other.totals,
             turn = other.turn,
             friend_throws = other.friend_throws,
             enemy_throws = other.enemy_throws,
@@ -42,7 +56,6 @@ class Node(GameState):
 
 
         self.parent = parent
-        self.is_fully_expanded = is_fully_expanded
 
         if friend_transitions is None:
             self.friend_transitions = []
@@ -61,9 +74,13 @@ class Node(GameState):
 
         self.q_value = q_value
         self.num_visits = num_visits
-        self.evaluation_score = evaluation_score
-        self.time_consumed = 0
-        self.start_time = self.end_time = 0
+
+        # Position in the parent's matrix, and the sums of the children's visits and scores for
+        # each row and column of this node's matrix, including prior visits. The matrix holds None
+        # for the children that haven't been made yet.
+        self.i = i
+        self.j = j
+        self.row_visits = self.row_scores = self.col_visits = self.col_scores = None
 
 
 
@@ -71,19 +88,28 @@ class Node(GameState):
         return Node(super().copy())
 
 
-    def unvisited_children(self, num_prior_visits=0):
+    def index_children(self):
         """
-        Return a list of children who have not been the root of a rollout yet.
+        Set the position in the matrix of each child that has been made
         """
+        for i, row in enumerate(self.matrix):
+            for j, child in enumerate(row):
+                if child is not None:
+                    child.i = i
+                    child.j = j
 
-        unvisited = []
-        for i in range(len(self.matrix)):
-            for j in range(len(self.matrix[0])):
-                child: Node = self.matrix[i][j]
-                if child.num_visits <= num_prior_visits:
-                    unvisited.append(child)
-        return unvisited
-
+    def make_child(self, i, j) -> "Node":
+        """
+        Make the child for row i and column j of the matrix, applying the row's friend transition
+        and the column's enemy transition to a copy of this node
+        """
+        child = self.copy_node_state()
+        child.update(self.friend_transitions[i], self.enemy_transitions[j])
+        child.parent = self
+        child.i = i
+        child.j = j
+        self.matrix[i][j] = child
+        return child
 
     def make_updated_node(self, friend_transition, enemy_transition, parent = None):
         """
@@ -103,10 +129,11 @@ class Node(GameState):
                 if curr_enemy_transition == enemy_transition:
                     enemy_index = j
 
-        if friend_index > -1 and enemy_index > -1:
+        if friend_index > -1 and enemy_index > -1 and self.matrix[friend_index][enemy_index] is not None:
             # Correct child node found
             updated_node: Node = self.matrix[friend_index][enemy_index]
             updated_node.parent = None
+            updated_node.i = updated_node.j = -1
             return updated_node
         else:
             # New node needs to be created
@@ -124,7 +151,6 @@ class Node(GameState):
         Display the value / num_visits. This is nice and small so fits into a matrix.
         """
         return f"{self.q_value:.2f}/{self.num_visits}"
-        # return f"{self.q_value}/{self.num_visits}/{self.evaluation_score}"
 
     def __lt__(self, other):
-        return self.evaluation_score < other.evaluation_score
+        return self.q_value < other.q_value
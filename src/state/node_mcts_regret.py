@@ -10,6 +10,12 @@ from state.game_state import GameState
 
 
 class Node(GameState):
+
+    __slots__ = (
+        'parent', 'is_fully_expanded', 'friend_transitions', 'enemy_transitions', 'matrix', 'regret',
+        'i', 'j', 'q_value', 'num_visits'
+    )
+
     def __init__(
         self,
         other: GameState,
@@ -32,8 +38,10 @@ class Node(GameState):
         """
         super().__init__(
             is_upper=other.is_upper,
-            friends=other.friends,
-            enemies=other.enemies,
+            boards=other.boards,
+            counts=other.counts,
+            stacks_key=other.stacks_key,
+            totals=other.totals,
             turn=other.turn,
             friend_throws=other.friend_throws,
             enemy_throws=other.enemy_throws,
@@ -0,0 +1,87 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+from state.bitboard import mask_from_indices
+from state.move import THROW, pack_move
+
+
+class ThrowPlans:
+    """
+    Precomputed throw pruning decisions.
+
+    Throws are pruned based on how far the nearest opponent row is from the farthest row a side
+    can throw to. If no opponent is within max_enemy_distance rows of it, only the throws to the
+    farthest row are kept and the plan holds those throws. Otherwise only throws to within some
+    distance of an opponent the thrown symbol defeats are kept, and the plan holds the mask of
+    the throw zone and that distance so the throws can be picked from the opponent distance
+    fields.
+    """
+
+    def __init__(
+        self, board, distant_throw_indices, max_throws, max_enemy_distance, max_enemy_distance_aggressive
+    ):
+        self.board = board
+        self.distant_throw_indices = distant_throw_indices
+        self.max_enemy_distance = max_enemy_distance
+        self.max_enemy_distance_aggressive = max_enemy_distance_aggressive
+        self.plans = {
+            (is_upper, throw_count, nearest_opponent_r, is_aggressive):
+                self.__compute_plan(is_upper, throw_count, nearest_opponent_r, is_aggressive)
+            for is_upper in (True, False)
+            for throw_count in range(max_throws)
+            for nearest_opponent_r in range(-4, 5)
+            for is_aggressive in (True, False)
+        }
+
+    def plan(self, is_upper, throw_count, nearest_opponent_r, is_aggressive):
+        """
+        Return a tuple of type (distant_throws, zone_mask, max_throw_enemy_distance), where
+        distant_throws is None if there are opponents near the throw zone.
+        """
+        return self.plans[(is_upper, throw_count, nearest_opponent_r, is_aggressive)]
+
+    def __compute_plan(self, is_upper, throw_count, nearest_opponent_r, is_aggressive):
+        throw_zone = self.board.get_throw_zone(is_upper, throw_count)
+        zone_rows = [self.board.rows[i] for i in throw_zone]
+        farthest_r = min(zone_rows) if is_upper else max(zone_rows)
+        max_enemy_distance = self.max_enemy_distance
+
+        if (is_upper and (nearest_opponent_r < farthest_r - max_enemy_distance)) or \
+            ((not is_upper) and (nearest_opponent_r > farthest_r + max_enemy_distance)):
+            return (self.__distant_throws(throw_zone, farthest_r, is_aggressive), 0, 0)
+
+        # Set the max distance away from an opponent token that a throw can be made to
+        if is_aggressive:
+            max_throw_enemy_distance = self.max_enemy_distance_aggressive
+        else:
+            max_throw_enemy_distance = max_enemy_distance
+
+        # Adjust max throw distance in case that the enemy is close but not past the
+        # max throw distance line
+        if (is_upper and nearest_opponent_r < farthest_r and nearest_opponent_r >= farthest_r - max_enemy_distance) \
+            or ((not is_upper) and nearest_opponent_r > farthest_r and nearest_opponent_r <= farthest_r + max_enemy_distance):
+            max_throw_enemy_distance = abs(nearest_opponent_r - farthest_r)
+
+        return (None, mask_from_indices(throw_zone), max_throw_enemy_distance)
+
+    def __distant_throws(self, throw_zone, farthest_r, is_aggressive):
+        """
+        Tuple of the throws to the farthest reachable row
+        """
+        if is_aggressive:
+            return tuple(
+                pack_move(THROW, 0, throw_i, symbol)
+                for symbol in range(3)
+                for throw_i in self.distant_throw_indices[farthest_r]
+            )
+        rows = self.board.rows
+        return tuple(
+            pack_move(THROW, 0, throw_i, symbol)
+            for throw_i in throw_zone if rows[throw_i] == farthest_r
+            for symbol in range(3)
+        )
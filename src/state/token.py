@@ -26,3 +26,41 @@ def defeats(a_t, b_t):
     return (a_t == "r" and b_t == "s") \
         or (a_t == "p" and b_t == "r") \
         or (a_t == "s" and b_t == "p")
+
+
+# Integer symbol codes used by the bitboard representation of the game state
+SYMBOLS = ('r', 'p', 's')
+SYMBOL_INDEX = {'r': 0, 'p': 1, 's': 2}
+
+# DEFEATS[i] is the symbol code that symbol i defeats, DEFEATED_BY[i] is the one that defeats it
+DEFEATS = (2, 0, 1)
+DEFEATED_BY = (1, 2, 0)
+
+
+def battle_defeated(present):
+    """
+    Symbol codes defeated in a battle on a hex, where present is the bitmask of the symbol codes
+    on the hex (bit i set if symbol i is there)
+    """
+    symbols = [symbol for symbol in range(3) if present >> symbol & 1]
+    if len(symbols) == 3:
+        return (0, 1, 2) # every symbol is defeated
+    if len(symbols) == 2:
+        return (symbols[1],) if DEFEATS[symbols[0]] == symbols[1] else (symbols[0],)
+    return ()
+
+
+# BATTLE_DEFEATED[present] is battle_defeated(present) for every present symbol bitmask
+BATTLE_DEFEATED = tuple(battle_defeated(present) for present in range(8))
+
+
+def has_undefeatable(present, opponent_present):
+    """
+    True if a side with the symbol codes in the bitmask present has a symbol that none of the
+    symbol codes in opponent_present defeat
+    """
+    return any(present >> symbol & 1 and not opponent_present >> DEFEATED_BY[symbol] & 1 for symbol in range(3))
+
+
+# HAS_UNDEFEATABLE[present << 3 | opponent_present] is has_undefeatable(present, opponent_present)
+HAS_UNDEFEATABLE = tuple(has_undefeatable(index >> 3, index & 7) for index in range(64))
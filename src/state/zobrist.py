@@ -0,0 +1,47 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+"""
+Zobrist keys for hashing game states.
+
+A position is identified the same way as the referee's Game._snap: the number of tokens of each
+symbol that each side has on every hex, plus the number of throws each side has used. Every
+(side, symbol, hex, count) combination and every (side, throw count) combination is given a random
+64 bit key, and the key of a position is the XOR of the keys of its parts. Changing a single count
+only requires two XORs to update the key.
+"""
+
+from random import Random
+
+MAX_STACK = 9
+MAX_THROWS = 9
+
+__random = Random(30024)
+
+
+def __random_keys(amount):
+    # The key for an empty entry is 0 so that empty hexes don't contribute to the position key
+    return tuple([0] + [__random.getrandbits(64) for _ in range(amount)])
+
+
+# STACK_KEYS[hex_index * 6 + plane][count], indexed the same way as GameState.counts
+STACK_KEYS = tuple(__random_keys(MAX_STACK) for _ in range(6 * 61))
+
+# THROW_KEYS[side][throw_count] with side 0 for friend and 1 for enemy
+THROW_KEYS = tuple(__random_keys(MAX_THROWS) for _ in range(2))
+
+
+def stacks_key(counts):
+    """
+    Compute the key for all stacks on the board from scratch, given GameState.counts
+    """
+    key = 0
+    for index, count in enumerate(counts):
+        if count:
+            key ^= STACK_KEYS[index][count]
+    return key
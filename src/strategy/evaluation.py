@@ -1,9 +1,39 @@
 from state.game_state import GameState
-from state.token import defeat_token
-from state.location import distance
+from state.token import DEFEATS, DEFEATED_BY, HAS_UNDEFEATABLE
+from state.bitboard import iter_bits
+from strategy.evaluation_cache import EvaluationCache, evaluation_cache, EVALUATE_STATE, EVALUATE_STATE_FAST
 import numpy as np
 from heapq import heappush, heappop
-from state.token import defeat_by_token
+from itertools import chain
+from strategy.features import FeaturePlan, register_feature, register_intermediate
+
+# Features of evaluate_state, in the order of its weights
+EVALUATE_STATE_FEATURES = (
+    'distance_to_killable',
+    'kills',
+    'useless',
+    'pieces_on_board',
+    'pieces_in_throw_range',
+    'pieces_in_move_range',
+    'distance_from_safeline',
+    'invincible',
+)
+EVALUATE_STATE_WEIGHTS = (
+    10,     # dist_to_killable_score_diff
+    200,    # num_killed_diff
+    -15,    # num_useless_diff
+    -30,    # pieces_on_board_diff
+    0,      # pieces_in_throw_range_diff -- disabled
+    -25,    # pieces_in_move_range_diff
+    0,      # distance_from_safeline_diff -- disabled
+    500,    # invincible_diff
+)
+FAST_FEATURES = ('distance_to_killable', 'kills')
+FAST_WEIGHTS = (10, 200)
+
+# (attacker plane, target plane) of each killable_distances component, friend attackers first
+KILLABLE_PLANES = tuple((DEFEATED_BY[symbol], 3 + symbol) for symbol in range(3)) + \
+    tuple((3 + DEFEATED_BY[symbol], symbol) for symbol in range(3))
 
 def evaluate_state_normalised(game_state: GameState):
     final_score = evaluate_state(game_state)
@@ -12,114 +42,277 @@ def evaluate_state_normalised(game_state: GameState):
 
 def evaluate_state(game_state: GameState, weights=None):
     """
-    takes a game state and estimates the future utility.
+    takes a game state and estimates the future utility. Scores with the default weights are
+    kept in the shared evaluation cache.
     """
+    if weights is None:
+        return evaluation_cache.evaluate(EVALUATE_STATE, game_state, uncached_evaluate_state)
+    return uncached_evaluate_state(game_state, weights)
+
+
+def uncached_evaluate_state(game_state: GameState, weights=None):
 
     goal = goal_reward(game_state)
     if goal is not None:
         return goal * 2000
 
-    # Distance to killable pieces score (fast) (TODO should be non-linear I think)
-    dist_to_killable_score_friend = distance_to_killable_score(game_state, is_friend=True)
-    dist_to_killable_score_enemy = distance_to_killable_score(game_state, is_friend=False)
-    dist_to_killable_score_diff = dist_to_killable_score_friend - dist_to_killable_score_enemy
-
-    # Number opponents killed (fast)
-    num_killed_diff = num_opponents_killed_difference(game_state)
-
-    # Number of useless pieces (fast)
-    num_friend_useless, num_enemy_useless = num_useless(game_state)
-    num_useless_diff = num_friend_useless - num_enemy_useless
+    if weights is None:
+        return EVALUATE_STATE_PLAN.score(game_state)
+    return FeaturePlan.for_weights(EVALUATE_STATE_FEATURES, weights).score(game_state)
 
-    # Throw range (medium)
-    # pieces_in_throw_range_diff = pieces_in_throw_range_difference(game_state)
 
-    # Number of pieces that could be killed with a single move of the opponent (slowest)
-    friend_move_to_pieces = game_state.moves_to_pieces(
-        game_state.next_swing_slide_transitions(is_friend=True), is_friend=True)
-    enemy_move_to_pieces = game_state.moves_to_pieces(
-        game_state.next_swing_slide_transitions(is_friend=False), is_friend=False)
-    pieces_in_move_range_diff = num_can_be_move_killed_difference(
-        game_state, friend_move_to_pieces, enemy_move_to_pieces)
+def evaluate_state_fast(game_state: GameState):
+    return evaluation_cache.evaluate(EVALUATE_STATE_FAST, game_state, uncached_evaluate_state_fast)
 
-    # Total distance of pieces from the throw line (slow)
-    # distance_from_safeline_diff = distance_from_safeline_difference(game_state)
 
-    # Invincible player
-    friend_is_invincible = __player_is_invincible(game_state, is_friend=True)
-    enemy_is_invincible = __player_is_invincible(game_state, is_friend=False)
-    invincible_diff = friend_is_invincible - enemy_is_invincible
+def uncached_evaluate_state_fast(game_state: GameState):
+    return FAST_PLAN.score(game_state)
 
-    pieces_on_board_diff = game_state.num_friends() - game_state.num_enemies()
 
-    scores = [
-        dist_to_killable_score_diff,
-        num_killed_diff,
-        num_useless_diff,
-        pieces_on_board_diff,
-        0,
-        pieces_in_move_range_diff,
-        0,
-        invincible_diff
-    ]
+class IncrementalEvaluator:
+    """
+    Evaluates states that differ from each other by a move pair, like the children of a node
+    or the replies to one move.
+
+    The distance to killable and move range features are built from components that each only
+    depend on a couple of bitmasks: the nearest attacker distances of each (attacker symbol,
+    target symbol) pair and the move reach of each side. A component keeps the bitmasks it was
+    last computed from and is reused while they are unchanged, so after a move pair (and any
+    battle it causes) only the components involving a changed symbol are recomputed. The
+    components are passed to the feature plans as their intermediates, the other features are
+    already kept up to date by the game state. Scores equal evaluate_state.
+    """
 
-    if weights is None:
-        weights = [
-            10,     # dist_to_killable_score_diff
-            200,    # num_killed_diff
-            -15,    # num_useless_diff
-            -30,   # pieces_on_board_diff
-            -25,    # pieces_in_throw_range_diff -- disabled
-            -25,    # pieces_in_move_range_diff
-            -3,     # distance_from_safeline_diff -- disabled
-            500,    # invincible_diff
-        ]
+    __slots__ = ('plan', 'killable', 'reach')
+
+    def __init__(self, weights=None):
+        if weights is None:
+            weights = EVALUATE_STATE_WEIGHTS
+        self.plan = FeaturePlan.for_weights(EVALUATE_STATE_FEATURES, weights)
+        # killable[k] is (attackers, targets, killable_distances(attackers, targets))
+        self.killable = [(None, None, ())] * len(KILLABLE_PLANES)
+        # reach[0] is (friend symbol masks, friend move reach), reach[1] is the same for enemies
+        self.reach = [(None, None), (None, None)]
+
+    def evaluate(self, game_state: GameState):
+        goal = goal_reward(game_state)
+        if goal is not None:
+            return goal * 2000
+        return self.plan.score(game_state, self.context(game_state, self.plan))
+
+    def evaluate_fast(self, game_state: GameState):
+        return FAST_PLAN.score(game_state, self.context(game_state, FAST_PLAN))
+
+    def context(self, game_state: GameState, plan):
+        """
+        The intermediates of a plan that this evaluator keeps
+        """
+        context = {}
+        if 'killable_distances' in plan.intermediates:
+            context['killable_distances'] = self.killable_components(game_state)
+        if 'move_reach' in plan.intermediates:
+            context['move_reach'] = (self.__move_reach(game_state, True), self.__move_reach(game_state, False))
+        return context
+
+    def killable_components(self, game_state: GameState):
+        """
+        The killable_distances intermediate, recomputing only the pairs whose bitmasks changed
+        """
+        boards = game_state.boards
+        killable = self.killable
+        components = []
+        for k, (attacker_plane, target_plane) in enumerate(KILLABLE_PLANES):
+            attackers = boards[attacker_plane]
+            targets = boards[target_plane]
+            cached_attackers, cached_targets, min_distances = killable[k]
+            if attackers != cached_attackers or targets != cached_targets:
+                min_distances = killable_distances(attackers, targets)
+                killable[k] = (attackers, targets, min_distances)
+            components.append(min_distances)
+        return components
+
+    def distance_to_killable_difference(self, game_state: GameState):
+        """
+        distance_to_killable_score of the friends minus that of the enemies
+        """
+        return distance_to_killable_difference(game_state, self.killable_components(game_state))
+
+    def move_killed_difference(self, game_state: GameState):
+        """
+        num_can_be_move_killed_difference, reusing a side's move reach while its tokens don't move
+        """
+        return num_can_be_move_killed_difference(
+            game_state, self.__move_reach(game_state, True), self.__move_reach(game_state, False))
+
+    def __move_reach(self, game_state: GameState, is_friend):
+        side = 0 if is_friend else 1
+        symbol_masks = game_state.symbol_masks(is_friend)
+        cached_masks, reach = self.reach[side]
+        if symbol_masks != cached_masks:
+            reach = game_state.move_reach(is_friend)
+            self.reach[side] = (symbol_masks, reach)
+        return reach
+
+
+class StateBatch:
+    """
+    The parts of many game states that evaluate_states needs, packed into rows of ints so that
+    the features of the whole batch are computed with NumPy at once.
 
+    add only reads the state, so states applied in place can be added and undone straight after.
+    The features that depend on where tokens are (distances to killable tokens and tokens in move
+    range) are found per state by add, everything else is derived from the packed columns. When
+    is_fast is True the move range feature is skipped, matching evaluate_state_fast.
 
+    When use_cache is True, states already in the evaluation cache aren't packed and the scores
+    of the packed states are added to the cache by evaluate_states.
+    """
 
-    result = np.dot(scores, weights)
+    # Columns of the packed rows
+    TOTALS = slice(0, 6)
+    FRIEND_THROWS = 6
+    ENEMY_THROWS = 7
+    LIMIT_REACHED = 8
+    TURN = 9
+    KILLABLE_DISTANCE = 10
+    MOVE_KILLED = 11
+    NUM_COLUMNS = 12
+
+    def __init__(self, game_states=(), is_fast=False, use_cache=True):
+        self.is_fast = is_fast
+        self.use_cache = use_cache
+        self.size = 0
+        self.rows = []
+        # Batch position and cache key of each packed row
+        self.row_positions = []
+        self.row_keys = []
+        # Batch positions and scores of the states found in the cache
+        self.cached_positions = []
+        self.cached_scores = []
+        # Batches are usually siblings, so the position dependent features are found incrementally
+        self.evaluator = IncrementalEvaluator()
+        for game_state in game_states:
+            self.add(game_state)
+
+    def add(self, game_state: GameState):
+        position = self.size
+        self.size += 1
+        if self.use_cache:
+            key = EvaluationCache.key(EVALUATE_STATE_FAST if self.is_fast else EVALUATE_STATE, game_state)
+            score = evaluation_cache.get(key)
+            if score is not None:
+                self.cached_positions.append(position)
+                self.cached_scores.append(score)
+                return
+            self.row_keys.append(key)
+        self.row_positions.append(position)
+
+        dist_to_killable_score_diff = self.evaluator.distance_to_killable_difference(game_state)
+        if self.is_fast:
+            pieces_in_move_range_diff = 0
+        else:
+            pieces_in_move_range_diff = self.evaluator.move_killed_difference(game_state)
+        self.rows.append((
+            *game_state.totals,
+            game_state.friend_throws,
+            game_state.enemy_throws,
+            game_state.existing_moves.limit_reached,
+            game_state.turn,
+            dist_to_killable_score_diff,
+            pieces_in_move_range_diff
+        ))
 
-    return result
+    def array(self):
+        return np.array(self.rows, dtype=np.int64).reshape(-1, StateBatch.NUM_COLUMNS)
 
-def evaluate_state_fast(game_state: GameState):
-    # Distance to killable pieces score (fast) (TODO should be non-linear I think)
-    dist_to_killable_score_friend = distance_to_killable_score(game_state, is_friend=True)
-    dist_to_killable_score_enemy = distance_to_killable_score(game_state, is_friend=False)
-    dist_to_killable_score_diff = dist_to_killable_score_friend - dist_to_killable_score_enemy
+    def __len__(self):
+        return self.size
 
-    # Number opponents killed (fast)
-    num_killed_diff = num_opponents_killed_difference(game_state)
 
-    scores = [dist_to_killable_score_diff, num_killed_diff]
-    weights = [10, 200]
+DEFAULT_WEIGHT_ARRAY = np.array(EVALUATE_STATE_WEIGHTS)
+FAST_WEIGHT_ARRAY = np.array(FAST_WEIGHTS)
 
-    result = np.dot(scores, weights)
 
-    return result
+def evaluate_states(batch: StateBatch, weights=None):
+    """
+    Vectorised evaluate_state (or evaluate_state_fast if the batch is fast) over every state
+    in a StateBatch. Return an array of scores in the order the states were added.
+    """
+    if weights is not None and batch.use_cache:
+        raise ValueError("cached scores use the default weights, make the batch with use_cache=False")
+    scores = __evaluate_packed(batch.array(), batch.is_fast, weights)
+    if not batch.use_cache:
+        return scores
+
+    for key, score in zip(batch.row_keys, scores.tolist()):
+        evaluation_cache.put(key, score)
+    if not batch.cached_positions:
+        return scores
+    all_scores = np.empty(batch.size)
+    all_scores[batch.row_positions] = scores
+    all_scores[batch.cached_positions] = batch.cached_scores
+    return all_scores
+
+
+def __evaluate_packed(packed, is_fast, weights):
+    dist_to_killable_score_diff = packed[:, StateBatch.KILLABLE_DISTANCE]
+    num_friends, num_enemies = __side_sizes(packed)
+    num_killed_diff = ((packed[:, StateBatch.ENEMY_THROWS] - num_enemies)
+                       - (packed[:, StateBatch.FRIEND_THROWS] - num_friends))
+
+    if is_fast:
+        scores = np.stack([dist_to_killable_score_diff, num_killed_diff], axis=1)
+        return scores @ FAST_WEIGHT_ARRAY
+
+    friend_useless, enemy_useless = __num_useless_batch(packed, num_friends, num_enemies)
+    friend_is_invincible, enemy_is_invincible = __players_are_invincible(packed)
+    zeros = np.zeros(len(packed), dtype=np.int64)
+    scores = np.stack([
+        dist_to_killable_score_diff,
+        num_killed_diff,
+        friend_useless - enemy_useless,
+        num_friends - num_enemies,
+        zeros,
+        packed[:, StateBatch.MOVE_KILLED],
+        zeros,
+        friend_is_invincible.astype(np.int64) - enemy_is_invincible
+    ], axis=1)
 
+    result = scores @ (DEFAULT_WEIGHT_ARRAY if weights is None else np.asarray(weights))
+    goals = goal_rewards(packed)
+    return np.where(np.isnan(goals), result, goals * 2000)
 
 
-def greedy_choose(game_state: GameState, weights=None, is_friend=True):
-    ref_transitions = game_state.next_friend_transitions() if is_friend else game_state.next_enemy_transitions()
+def greedy_choose(game_state: GameState, weights=None, is_friend=True, transitions=None, rng=None):
+    """
+    The move of a side that gives the best evaluation, out of transitions or every move of the side.
+    Ties are broken with rng if it is given, otherwise with numpy's global generator.
+    """
+    if transitions is not None:
+        ref_transitions = transitions
+    elif is_friend:
+        ref_transitions = game_state.next_friend_transitions()
+    else:
+        ref_transitions = game_state.next_enemy_transitions()
     multiplier = -1 if is_friend else 1
 
 
-    queue = []
+    batch = StateBatch(use_cache=weights is None)
     for ref_transition in ref_transitions:
-        # New game state based on possible friend transition (enemy pieces stay the same)
-        new_state = game_state.copy()
+        # Apply the possible transition in place (other side's pieces stay the same)
         if is_friend:
-            new_state.update(friend_transition=ref_transition)
+            undo_token = game_state.apply(friend_transition=ref_transition)
         else:
-            new_state.update(enemy_transition=ref_transition)
-
-        # new_state = game_state.update(friend_transition=friend_transition)
+            undo_token = game_state.apply(enemy_transition=ref_transition)
+        batch.add(game_state)
+        game_state.undo(undo_token)
 
-        # Find the evaluation score
-        eval_score = evaluate_state(new_state, weights)
+    # Find the evaluation scores of every transition at once
+    eval_scores = evaluate_states(batch, weights)
 
+    queue = []
+    for eval_score, ref_transition in zip(eval_scores, ref_transitions):
         # Add to queue. Use negative of score as first element of tuple since it is a min heap
-        # A tuple of the individual scores are also included here for debugging purposes only
         heappush(queue, (multiplier * eval_score, ref_transition))
 
     (best_score, best_move) = heappop(queue)
@@ -133,6 +326,8 @@ def greedy_choose(game_state: GameState, weights=None, is_friend=True):
             possible_moves.append((curr_score, *rest))
 
     # Randomly pick from that list
+    if rng is not None:
+        return possible_moves[rng.randrange(len(possible_moves))][1]
     return possible_moves[np.random.choice(len(possible_moves), 1)[0]][1]
 
 
@@ -156,24 +351,23 @@ def pieces_in_throw_range(game_state: GameState, is_friend):
     if is_friend:
         opponent_row = GameState.farthest_r(game_state.enemy_throws, not game_state.is_upper)
         opponent_throws = game_state.enemy_throws
-        pieces = game_state.friends
         is_upper = game_state.is_upper
 
     else:
         opponent_row = GameState.farthest_r(game_state.friend_throws, game_state.is_upper)
         opponent_throws = game_state.friend_throws
-        pieces = game_state.enemies
         is_upper = not game_state.is_upper
+    pieces = iter_bits(game_state.occupied(is_friend))
     count = 0
 
     if is_upper and (opponent_throws < game_state.MAX_THROWS):
-        for (r, _) in pieces.keys():
-            if r <= opponent_row:
+        for i in pieces:
+            if GameState.board.rows[i] <= opponent_row:
                 count += 1
 
     elif (not is_upper) and (opponent_throws < game_state.MAX_THROWS):
-        for (r, _) in pieces.keys():
-            if r >= opponent_row:
+        for i in pieces:
+            if GameState.board.rows[i] >= opponent_row:
                 count += 1
 
     return count
@@ -188,22 +382,21 @@ def distance_from_safeline(game_state: GameState, is_friend):
     if is_friend:
         safe_row = GameState.farthest_r(
             game_state.friend_throws, game_state.is_upper)
-        reference = game_state.friends
         is_upper = game_state.is_upper
     else:
         safe_row = GameState.farthest_r(
             game_state.enemy_throws, not game_state.is_upper)
-        reference = game_state.enemies
         is_upper = not game_state.is_upper
+    reference = iter_bits(game_state.occupied(is_friend))
 
     total_distance = 0
 
     if is_upper:
-        for (r, _) in reference.keys():
-            total_distance += max(0, safe_row - r)
+        for i in reference:
+            total_distance += max(0, safe_row - GameState.board.rows[i])
     else:
-        for (r, _) in reference.keys():
-            total_distance += max(0, r - safe_row)
+        for i in reference:
+            total_distance += max(0, GameState.board.rows[i] - safe_row)
     
     return total_distance
 
@@ -212,22 +405,8 @@ def num_opponents_killed_difference(game_state: GameState):
 
 
 def num_useless(game_state: GameState):
-    f_rocks = f_papers = f_scissors = e_rocks = e_papers = e_scissors = 0
-
-    for f_tokens in game_state.friends.values():
-        if f_tokens[0] == 'r':
-            f_rocks += len(f_tokens)
-        elif f_tokens[0] == 'p':
-            f_papers += len(f_tokens)
-        else:
-            f_scissors += len(f_tokens)
-    for e_tokens in game_state.enemies.values():
-        if e_tokens[0] == 'r':
-            e_rocks += len(e_tokens)
-        elif e_tokens[0] == 'p':
-            e_papers += len(e_tokens)
-        else:
-            e_scissors += len(e_tokens)
+    f_rocks, f_papers, f_scissors = game_state.symbol_counts(is_friend=True)
+    e_rocks, e_papers, e_scissors = game_state.symbol_counts(is_friend=False)
 
     friend_useless = max(f_rocks - e_scissors, 0) + max(f_papers - e_rocks, 0) + max(f_scissors - e_papers, 0)
     enemy_useless = max(e_rocks - f_scissors, 0) + max(e_papers - f_rocks, 0) + max(e_scissors - f_papers, 0)
@@ -260,34 +439,70 @@ def distance_to_killable_score(game_state: GameState, is_friend):
     rock that is much further away, a single score will be awarded for the closest pair only.
     """
 
-    if is_friend:
-        this_side_pieces = game_state.friends
-        opponent_side_pieces = game_state.enemies
-    else:
-        this_side_pieces = game_state.enemies
-        opponent_side_pieces = game_state.friends
+    this_side_pieces = game_state.symbol_masks(is_friend)
+    opponent_side_pieces = game_state.symbol_masks(not is_friend)
+
+    return nearest_killable_score([
+        # Only the friends with the symbol that defeats this enemy symbol are of interest
+        killable_distances(this_side_pieces[DEFEATED_BY[en_symbol]], opponent_side_pieces[en_symbol])
+        for en_symbol in range(3)
+    ])
+
+
+def distance_to_killable_difference(game_state: GameState, components):
+    """
+    distance_to_killable_score of the friends minus that of the enemies, given the
+    killable_distances of each pair in KILLABLE_PLANES
+    """
+    return nearest_killable_score(components[0:3]) - nearest_killable_score(components[3:6])
+
 
+def killable_components(game_state: GameState):
+    """
+    killable_distances of each pair of planes in KILLABLE_PLANES
+    """
+    boards = game_state.boards
+    return [killable_distances(boards[attackers], boards[targets]) for attackers, targets in KILLABLE_PLANES]
+
+
+def killable_distances(attackers, targets):
+    """
+    Sorted tuple of type ((min_distance, attacker_i), ...) with an entry for each hex in the
+    targets bitmask, giving the nearest hex in the attackers bitmask. min_distance is 8 and
+    attacker_i is -1 if there are no attackers.
+    """
+    if not targets:
+        return ()
+    distance_rows = GameState.board.distance_rows
+    attackers = iter_bits(attackers)
     min_distances = []
 
-    for en_loc, en_tokens in opponent_side_pieces.items():
+    for en_i in iter_bits(targets):
         min_distance = 8
-        min_fr_loc = None
-        for fr_loc, fr_tokens in this_side_pieces.items():
-            if en_tokens[0] == defeat_token(fr_tokens[0]):
-                token_distance = distance(fr_loc, en_loc)
-                if token_distance < min_distance:
-                    min_distance = token_distance
-                    min_fr_loc = fr_loc
-        heappush(min_distances, (min_distance, min_fr_loc))
+        min_fr_i = -1
+        for fr_i in attackers:
+            distance = distance_rows[fr_i][en_i]
+            if distance < min_distance:
+                min_distance = distance
+                min_fr_i = fr_i
+        min_distances.append((min_distance, min_fr_i))
+
+    min_distances.sort()
+    return tuple(min_distances)
+
 
+def nearest_killable_score(killable_distances_per_symbol):
+    """
+    Combine the killable_distances of each symbol into the distance_to_killable_score, scoring
+    each attacker only for its closest target.
+    """
     used_fr_locs = set()
     return_distances = 0
 
-    while len(min_distances) > 0:
-        (min_distance, fr_loc) = heappop(min_distances)
-        if fr_loc not in used_fr_locs:
+    for (min_distance, fr_i) in sorted(chain.from_iterable(killable_distances_per_symbol)):
+        if fr_i not in used_fr_locs:
             return_distances += 8 - min_distance
-            used_fr_locs.add(fr_loc)
+            used_fr_locs.add(fr_i)
 
     return return_distances
 
@@ -297,50 +512,72 @@ def num_can_be_move_killed_difference(game_state, friend_move_to_pieces, enemy_m
             -num_can_be_move_killed(game_state, friend_move_to_pieces, is_friend=False)) 
 
 def num_can_be_move_killed(game_state: GameState, move_to_pieces, is_friend):
-
-    reference = game_state.friends if is_friend else game_state.enemies
+    """
+    Count the pieces of a side standing on a hex that an opponent token which defeats them can
+    move to. move_to_pieces are the opponent reach masks from GameState.move_reach.
+    """
+    base = 0 if is_friend else 3
     count = 0
 
-    for curr_loc, curr_tokens in reference.items():
-        if curr_loc in move_to_pieces:
-            if defeat_by_token(curr_tokens[0]) in move_to_pieces[curr_loc]:
-                count += len(curr_tokens)
+    for symbol, symbol_mask in enumerate(game_state.symbol_masks(is_friend)):
+        for i in iter_bits(symbol_mask & move_to_pieces[DEFEATED_BY[symbol]]):
+            count += game_state.count_at(base + symbol, i)
     return count
 
 existing_moves = set()
 
 def goal_reward(game_state: GameState):
     """
-    Return False if goal state has not been reached
+    Return None if goal state has not been reached
     Return 1 if friend has won
     Return 0 if a draw has occurred
     Return -1 if the enemy has won
+
+    Only the symbol totals kept by the game state are read, and once a side has used all of its
+    throws the result is memoised on the game state until it changes.
     """
     # 0.    If both players have throws available, goal state definitely has not been reached
 
-    if game_state.friend_throws < game_state.MAX_THROWS and game_state.enemy_throws < game_state.MAX_THROWS:
+    if game_state.friend_throws < GameState.MAX_THROWS and game_state.enemy_throws < GameState.MAX_THROWS:
         return None
 
+    goal = game_state.goal
+    if goal == GameState.GOAL_UNKNOWN:
+        goal = __late_goal_reward(game_state)
+        game_state.goal = goal
+    return goal
+
+
+def __late_goal_reward(game_state: GameState):
+    """
+    goal_reward once at least one player has used all of their throws
+    """
+    friend_throws_are_out = game_state.friend_throws == GameState.MAX_THROWS
+    enemy_throws_are_out = game_state.enemy_throws == GameState.MAX_THROWS
+    f_rocks, f_papers, f_scissors, e_rocks, e_papers, e_scissors = game_state.totals
+    num_friends = f_rocks + f_papers + f_scissors
+    num_enemies = e_rocks + e_papers + e_scissors
+
     # 1.    One player has no remaining throws and all of their tokens have been defeated:
     #       If the other player still has tokens or throws, declare that player the winner.
     #       Otherwise, declare a draw.
 
-    friend_moves_are_available = __moves_are_available(game_state, is_friend=True)
-    enemy_moves_are_available = __moves_are_available(game_state, is_friend=False)
+    friend_moves_are_available = num_friends or not friend_throws_are_out
+    enemy_moves_are_available = num_enemies or not enemy_throws_are_out
 
-    if friend_moves_are_available and not enemy_moves_are_available:
-        return 1
-    elif not friend_moves_are_available and enemy_moves_are_available:
+    if not enemy_moves_are_available:
+        return 1 if friend_moves_are_available else 0
+    elif not friend_moves_are_available:
         return -1
-    elif not friend_moves_are_available and not enemy_moves_are_available:
-        return 0
 
     # 2.    A token is invincible if it cannot be defeated by the opponent’s remaining tokens,
     #       and the opponent has no remaining throws. Both players have an invincible token:
     #       Declare a draw
 
-    friend_is_invincible = __player_is_invincible(game_state, is_friend=True)
-    enemy_is_invincible = __player_is_invincible(game_state, is_friend=False)
+    friend_present = (f_rocks > 0) | (f_papers > 0) << 1 | (f_scissors > 0) << 2
+    enemy_present = (e_rocks > 0) | (e_papers > 0) << 1 | (e_scissors > 0) << 2
+    friend_is_invincible = enemy_throws_are_out and HAS_UNDEFEATABLE[friend_present << 3 | enemy_present]
+    enemy_is_invincible = friend_throws_are_out and HAS_UNDEFEATABLE[enemy_present << 3 | friend_present]
 
     if friend_is_invincible and enemy_is_invincible:
         return 0
@@ -349,9 +586,9 @@ def goal_reward(game_state: GameState):
     #       remaining token (not invincible): Declare the player with the invincible token the
     #       winner
 
-    elif friend_is_invincible and not enemy_is_invincible and game_state.num_enemies() == 1:
+    elif friend_is_invincible and num_enemies == 1:
         return 1
-    elif not friend_is_invincible and enemy_is_invincible and game_state.num_friends() == 1:
+    elif enemy_is_invincible and num_friends == 1:
         return -1
 
     # 4.    One game configuration (with the same number of tokens with each symbol and
@@ -370,48 +607,103 @@ def goal_reward(game_state: GameState):
 
     return None
 
-def __moves_are_available(game_state: GameState, is_friend):
+def goal_rewards(packed):
     """
-    Return true if there are any moves or throws available to the player
+    Vectorised goal_reward over the rows of StateBatch.array(), with NaN where goal_reward
+    would return None.
     """
-    if is_friend:
-        return not (game_state.friend_throws == game_state.MAX_THROWS and len(game_state.friends) == 0)
-    else:
-        return not (game_state.enemy_throws == game_state.MAX_THROWS and len(game_state.enemies) == 0)
+    num_friends, num_enemies = __side_sizes(packed)
+    friend_throws_are_out = packed[:, StateBatch.FRIEND_THROWS] == GameState.MAX_THROWS
+    enemy_throws_are_out = packed[:, StateBatch.ENEMY_THROWS] == GameState.MAX_THROWS
+    friend_moves_are_available = ~(friend_throws_are_out & (num_friends == 0))
+    enemy_moves_are_available = ~(enemy_throws_are_out & (num_enemies == 0))
+    friend_is_invincible, enemy_is_invincible = __players_are_invincible(packed)
+
+    # The conditions of goal_reward are written from last to first so earlier ones take priority
+    rewards = np.full(len(packed), np.nan)
+    rewards[(packed[:, StateBatch.LIMIT_REACHED] != 0) | (packed[:, StateBatch.TURN] == GameState.MAX_TURNS)] = 0
+    rewards[~friend_is_invincible & enemy_is_invincible & (num_friends == 1)] = -1
+    rewards[friend_is_invincible & ~enemy_is_invincible & (num_enemies == 1)] = 1
+    rewards[friend_is_invincible & enemy_is_invincible] = 0
+    moves_are_unavailable = ~(friend_moves_are_available & enemy_moves_are_available)
+    rewards[moves_are_unavailable] = (
+        friend_moves_are_available.astype(np.int64) - enemy_moves_are_available)[moves_are_unavailable]
+    rewards[~(friend_throws_are_out | enemy_throws_are_out)] = np.nan
+    return rewards
+
+
+def __side_sizes(packed):
+    totals = packed[:, StateBatch.TOTALS]
+    return totals[:, 0:3].sum(axis=1), totals[:, 3:6].sum(axis=1)
+
+
+def __num_useless_batch(packed, num_friends, num_enemies):
+    """
+    Vectorised num_useless over the rows of StateBatch.array()
+    """
+    friend_counts = packed[:, 0:3]
+    enemy_counts = packed[:, 3:6]
+    friend_useless = np.maximum(friend_counts - enemy_counts[:, DEFEATS], 0).sum(axis=1)
+    enemy_useless = np.maximum(enemy_counts - friend_counts[:, DEFEATS], 0).sum(axis=1)
+
+    friend_discount = (packed[:, StateBatch.ENEMY_THROWS] == GameState.MAX_THROWS) & (num_friends > num_enemies)
+    enemy_discount = (packed[:, StateBatch.FRIEND_THROWS] == GameState.MAX_THROWS) & (num_enemies > num_friends)
+    friend_useless = friend_useless - np.where(friend_discount, num_friends - num_enemies, 0)
+    enemy_useless = enemy_useless - np.where(enemy_discount, num_enemies - num_friends, 0)
+    return friend_useless, enemy_useless
 
 
-def __player_is_invincible(game_state: GameState, is_friend):
+def __players_are_invincible(packed):
     """
-    Return true if player has at least one token that it is impossible for the other side
-    to kill
+    Vectorised __players_invincibility over the rows of StateBatch.array()
     """
-    if is_friend and game_state.enemy_throws < GameState.MAX_THROWS:
-        return False
-    elif not is_friend and game_state.friend_throws < GameState.MAX_THROWS:
-        return False
-    friend_tokens = __tokens_on_board(game_state, is_friend=True)
-    enemy_tokens = __tokens_on_board(game_state, is_friend=False)
-    if len(friend_tokens) == 3 and len(enemy_tokens) == 3:
-        return False
-    if is_friend:
-        for friend_token in friend_tokens:
-            if defeat_by_token(friend_token) not in enemy_tokens:
-                return True
+    friend_counts = packed[:, 0:3]
+    enemy_counts = packed[:, 3:6]
+    friend_is_invincible = (packed[:, StateBatch.ENEMY_THROWS] == GameState.MAX_THROWS) & \
+        ((friend_counts > 0) & (enemy_counts[:, DEFEATED_BY] == 0)).any(axis=1)
+    enemy_is_invincible = (packed[:, StateBatch.FRIEND_THROWS] == GameState.MAX_THROWS) & \
+        ((enemy_counts > 0) & (friend_counts[:, DEFEATED_BY] == 0)).any(axis=1)
+    return friend_is_invincible, enemy_is_invincible
 
-        return False
-    else:
-        for enemy_token in enemy_tokens:
-            if defeat_by_token(enemy_token) not in friend_tokens:
-                return True
-        return False
 
-def __tokens_on_board(game_state: GameState, is_friend) -> set:
+def __players_invincibility(game_state: GameState):
     """
-    Return a set of all tokens currently on the board for a player
+    Return whether the friend and the enemy each have at least one token that it is impossible
+    for the other side to kill
     """
-    reference = game_state.friends if is_friend else game_state.enemies
-    tokens_types = set()
-    for tokens in reference.values():
-        for token in tokens:
-            tokens_types.add(token)
-    return tokens_types
+    friend_present = game_state.symbol_presence(is_friend=True)
+    enemy_present = game_state.symbol_presence(is_friend=False)
+    friend_is_invincible = game_state.enemy_throws == GameState.MAX_THROWS and \
+        HAS_UNDEFEATABLE[friend_present << 3 | enemy_present]
+    enemy_is_invincible = game_state.friend_throws == GameState.MAX_THROWS and \
+        HAS_UNDEFEATABLE[enemy_present << 3 | friend_present]
+    return friend_is_invincible, enemy_is_invincible
+
+
+def num_useless_difference(game_state: GameState):
+    num_friend_useless, num_enemy_useless = num_useless(game_state)
+    return num_friend_useless - num_enemy_useless
+
+
+def invincible_difference(game_state: GameState):
+    friend_is_invincible, enemy_is_invincible = __players_invincibility(game_state)
+    return friend_is_invincible - enemy_is_invincible
+
+
+register_intermediate('killable_distances', killable_components)
+register_intermediate('move_reach', lambda game_state: (
+    game_state.move_reach(is_friend=True), game_state.move_reach(is_friend=False)))
+
+register_feature('distance_to_killable', distance_to_killable_difference, requires=('killable_distances',))
+register_feature('kills', num_opponents_killed_difference)
+register_feature('useless', num_useless_difference)
+register_feature('pieces_on_board', lambda game_state: game_state.num_friends() - game_state.num_enemies())
+# Disabled in evaluate_state, it scores them 0 whatever their weights, as StateBatch does
+register_feature('pieces_in_throw_range', lambda game_state: 0)
+register_feature('pieces_in_move_range', lambda game_state, reach: num_can_be_move_killed_difference(game_state, *reach),
+                 requires=('move_reach',))
+register_feature('distance_from_safeline', lambda game_state: 0)
+register_feature('invincible', invincible_difference)
+
+EVALUATE_STATE_PLAN = FeaturePlan.for_weights(EVALUATE_STATE_FEATURES, EVALUATE_STATE_WEIGHTS)
+FAST_PLAN = FeaturePlan.for_weights(FAST_FEATURES, FAST_WEIGHTS)
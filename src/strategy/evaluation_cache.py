@@ -0,0 +1,104 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+"""
+
+from collections import OrderedDict
+from state.game_state import GameState
+
+# Kinds of evaluation kept in the cache, scores of different kinds never share an entry
+EVALUATE_STATE = 0
+EVALUATE_STATE_FAST = 1
+ML_EVALUATE = 2
+KIND_NAMES = ('evaluate_state', 'evaluate_state_fast', 'ml_evaluation')
+
+EVALUATION_CACHE_SIZE = 32768
+
+
+class EvaluationCache:
+    """
+    Bounded least recently used cache of evaluation scores, keyed by position.
+
+    The same position is often evaluated several times in a turn (pruning, priors and rollouts)
+    and again in later turns, so one cache is shared by every strategy module and is never
+    cleared between turns. A position is identified by its Zobrist key, which covers the tokens
+    and throws of both sides, along with the parts of the game state that decide whether the game
+    has ended by repetition or turn limit and the side that is upper.
+
+    Hits and misses are counted per kind so the hit rate can be weighed against the memory used,
+    see benchmark for the bytes held per entry.
+    """
+
+    __slots__ = ('max_size', 'entries', 'hits', 'misses')
+
+    def __init__(self, max_size=EVALUATION_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = [0] * len(KIND_NAMES)
+        self.misses = [0] * len(KIND_NAMES)
+
+    @staticmethod
+    def key(kind, game_state: GameState):
+        return (
+            kind, game_state.key, game_state.is_upper, game_state.existing_moves.limit_reached,
+            game_state.turn >= GameState.MAX_TURNS
+        )
+
+    def get(self, key):
+        """
+        Return the cached score for a key from EvaluationCache.key, or None if it isn't cached
+        """
+        score = self.entries.get(key)
+        if score is None:
+            self.misses[key[0]] += 1
+        else:
+            self.hits[key[0]] += 1
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                # Evicted by a search in another thread since it was read
+                pass
+        return score
+
+    def put(self, key, score):
+        self.entries[key] = score
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def evaluate(self, kind, game_state: GameState, evaluate):
+        """
+        Return the score of a game state, calling evaluate(game_state) if it isn't cached
+        """
+        key = EvaluationCache.key(kind, game_state)
+        score = self.get(key)
+        if score is None:
+            score = evaluate(game_state)
+            self.put(key, score)
+        return score
+
+    def hit_rate(self, kind=None):
+        """
+        Fraction of lookups of a kind (or of every kind if kind is None) that were hits
+        """
+        hits = sum(self.hits) if kind is None else self.hits[kind]
+        misses = sum(self.misses) if kind is None else self.misses[kind]
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = [0] * len(KIND_NAMES)
+        self.misses = [0] * len(KIND_NAMES)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        rates = ", ".join(f"{name}={self.hit_rate(kind):.2f}" for kind, name in enumerate(KIND_NAMES))
+        return f"EvaluationCache(size={len(self.entries)}/{self.max_size}, hit rates: {rates})"
+
+
+# Shared by every strategy module
+evaluation_cache = EvaluationCache()
@@ -0,0 +1,114 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+
+Registry of evaluation features
+
+A feature is a function of a game state that an evaluation weights, an intermediate is a value
+that one or more features (or other intermediates) are computed from, like the move reach of
+each side or the distance fields of the tokens. Both declare the intermediates they require by
+name and are called as compute(game_state, *required_values).
+
+A FeaturePlan is built once for a list of (feature name, weight) pairs. It drops the features
+with a weight of 0 and works out which intermediates the rest need, so each evaluation computes
+only the weighted features and each intermediate at most once.
+"""
+
+import numpy as np
+
+FEATURES = {}
+INTERMEDIATES = {}
+
+
+class Feature:
+
+    __slots__ = ('name', 'compute', 'requires')
+
+    def __init__(self, name, compute, requires=()):
+        self.name = name
+        self.compute = compute
+        self.requires = requires
+
+    def __repr__(self):
+        return f"Feature({self.name}, requires={self.requires})"
+
+
+def register_feature(name, compute, requires=()):
+    if name in FEATURES:
+        raise ValueError(f"feature {name} is already registered")
+    FEATURES[name] = Feature(name, compute, requires)
+
+
+def register_intermediate(name, compute, requires=()):
+    if name in INTERMEDIATES:
+        raise ValueError(f"intermediate {name} is already registered")
+    INTERMEDIATES[name] = Feature(name, compute, requires)
+
+
+class FeaturePlan:
+    """
+    The weighted features of an evaluation, in order, and the intermediates they need, ordered so
+    that every intermediate comes after the ones it requires.
+    """
+
+    __slots__ = ('names', 'features', 'weights', 'intermediates')
+
+    # Plans already built, keyed by the (name, weight) pairs
+    plans = {}
+
+    def __init__(self, weighted_features):
+        weighted_features = [(name, weight) for name, weight in weighted_features if weight != 0]
+        self.names = tuple(name for name, _ in weighted_features)
+        self.features = tuple(FEATURES[name] for name in self.names)
+        self.weights = np.array([weight for _, weight in weighted_features])
+        self.intermediates = []
+        for feature in self.features:
+            self.__add_intermediates(feature.requires)
+        self.intermediates = tuple(self.intermediates)
+
+    @staticmethod
+    def for_weights(names, weights):
+        """
+        Return the plan for the features with the given names and weights, building it once
+        """
+        key = tuple(zip(names, weights))
+        plan = FeaturePlan.plans.get(key)
+        if plan is None:
+            plan = FeaturePlan(key)
+            FeaturePlan.plans[key] = plan
+        return plan
+
+    def __add_intermediates(self, names):
+        for name in names:
+            if name not in self.intermediates:
+                self.__add_intermediates(INTERMEDIATES[name].requires)
+                self.intermediates.append(name)
+
+    def values(self, game_state, context=None):
+        """
+        List of the weighted feature values of a game state. context is a dict of intermediates
+        that have already been computed, like those kept by an IncrementalEvaluator, it is filled
+        with the ones this plan computes.
+        """
+        if context is None:
+            context = {}
+        for name in self.intermediates:
+            if name not in context:
+                intermediate = INTERMEDIATES[name]
+                context[name] = intermediate.compute(game_state, *[context[r] for r in intermediate.requires])
+        values = []
+        for feature in self.features:
+            if feature.requires:
+                values.append(feature.compute(game_state, *[context[r] for r in feature.requires]))
+            else:
+                values.append(feature.compute(game_state))
+        return values
+
+    def score(self, game_state, context=None):
+        return np.dot(self.values(game_state, context), self.weights)
+
+    def __repr__(self):
+        return f"FeaturePlan({', '.join(self.names)}; intermediates: {', '.join(self.intermediates)})"
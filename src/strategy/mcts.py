@@ -69,7 +69,7 @@ def print_stats(root: Node):
         ratio = 0
     print(f"* {winning_node.q_value:4} / {winning_node.num_visits:4}  "
         + f"{ratio:+.3f}  "
-        + f"move: {winning_node.action}")
+        + f"move: {GameState.decode_move(winning_node.action)}")
     print(f"* CHILD STATS")
 
     print(f"*  Score | Visits | Ratio  |          Move")
@@ -79,7 +79,7 @@ def print_stats(root: Node):
             ratio = child. q_value / child.num_visits
         else:
             ratio = 0
-        print(f"* {child.q_value:+6} | {child.num_visits:+6} | {ratio:+.3f} | move: {child.action}")
+        print(f"* {child.q_value:+6} | {child.num_visits:+6} | {ratio:+.3f} | move: {GameState.decode_move(child.action)}")
 
 
 def traverse(node: Node):
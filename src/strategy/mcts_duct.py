@@ -29,75 +29,195 @@ https://github.com/AdamStelmaszczyk/gtsa/blob/master/cpp/gtsa.hpp
 
 """
 
-from heapq import heappush, heappop
-from random import randrange
+import random
 from time import time
-from random import shuffle
 from state.game_state import GameState
 from strategy.rando_util import biased_random_move
 import strategy.evaluation as eval
-from strategy.minimax import minimax_paranoid_reduction_tree
+import strategy.ml_evaluation as ml
+from strategy.move_scoring import shortlist, static_move_scores
 import numpy as np
 from state.node_mcts_duct import Node
 DEBUG_MODE = False
 USE_PRUNING = True
 NUM_TO_KEEP = 5
-rollout_count = 0
-
-exp_constant = 0.8 # np.sqrt(2)
-start_time = end_time = time_consumed = 0
-is_using_prior = False
-is_using_fast_rollout_eval=False
-is_using_fast_prune_eval=False
-num_prior_visits = 4
-
-def start_timer():
-    global start_time
-    start_time = time()
-
-def end_timer():
-    global start_time, end_time, time_consumed
-    end_time = time()
-    time_consumed += end_time - start_time
 
+EXPLORATION_CONSTANT = 0.8 # np.sqrt(2)
+# Visits a node needs before it is expanded, the root is always expanded
+EXPANSION_VISITS = 16
+# Candidates per side that the static move scorer shortlists for evaluation when pruning, None
+# evaluates every move
+CASCADE_SHORTLIST = None
+# Score a leaf counts as for the side that selected it while its batch is being rolled out, so
+# that the other traversals of the batch spread out over the tree
+VIRTUAL_LOSS = 1
+
+
+class CascadeStats:
+    """
+    Counts for the pruning cascade. Of the prunings that were checked against evaluating every
+    move, changed is how many kept a different set of moves for either side.
+    """
+
+    def __init__(self):
+        self.prunings = 0
+        self.candidates = 0
+        self.evaluated = 0
+        self.checks = 0
+        self.changed = 0
+
+    def change_rate(self):
+        return self.changed / self.checks if self.checks else 0.0
+
+    def __repr__(self):
+        return (f"CascadeStats(prunings={self.prunings}, evaluated {self.evaluated}/{self.candidates} moves, "
+                + f"changed top moves {self.changed}/{self.checks} checks)")
+
+
+class SearchContext:
+    """
+    Settings, random number generator, time budget and counters of one search. Every function of
+    the search takes the context instead of reading module globals, so several searches can run
+    in one process, each with its own context.
+
+    See monte_carlo_tree_search for the settings. A seed makes the search repeatable, rollouts in
+    a pool are seeded from it too.
+
+    Searches in different threads still share the evaluation cache and GameState.move_cache. Their
+    entries don't depend on the search, so sharing them is safe, but their hit and miss counts can
+    miss increments. Each search must have its own tree.
+    """
+
+    def __init__(
+            self,
+            playout_amount=6,
+            outer_cutoff=5,
+            num_iterations=float("inf"),
+            turn_time=float("inf"),
+            exploration_constant=EXPLORATION_CONSTANT,
+            verbosity=0,
+            use_prior=True,
+            num_priors=4,
+            use_fast_rollout_eval=False,
+            use_fast_prune_eval=False,
+            use_ml_leaf_eval=False,
+            cascade_size=CASCADE_SHORTLIST,
+            cascade_check=0,
+            scorer=static_move_scores,
+            expand_after=EXPANSION_VISITS,
+            leaf_batch=1,
+            rollout_pool=None,
+            seed=None
+        ):
+        self.playout_amount = playout_amount
+        self.outer_cutoff = outer_cutoff
+        self.num_iterations = num_iterations
+        self.turn_time = turn_time
+        self.exp_constant = exploration_constant
+        self.verbosity = verbosity
+        self.is_using_prior = use_prior
+        self.num_prior_visits = num_priors
+        self.is_using_fast_rollout_eval = use_fast_rollout_eval
+        self.is_using_fast_prune_eval = use_fast_prune_eval
+        self.is_using_ml_leaf_eval = use_ml_leaf_eval
+        self.cascade_shortlist = cascade_size
+        self.cascade_check_rate = cascade_check
+        self.move_scorer = scorer
+        self.expansion_visits = expand_after
+        self.leaf_batch = leaf_batch
+        self.rollout_pool = rollout_pool
+
+        self.rng = random.Random(seed)
+        self.start_time = 0
+        self.rollout_count = 0
+        self.cascade_stats = CascadeStats()
+
+    def has_budget(self, root: Node):
+        """ whether the search can make another iteration."""
+        return time() < self.start_time + self.turn_time and root.num_visits < self.num_iterations
 
 
 def monte_carlo_tree_search(
         root: Node, 
         playout_amount=6, 
-        node_cutoff=100, 
         outer_cutoff=5, 
         num_iterations=float("inf"), 
         turn_time=float("inf"), 
         exploration_constant=0,
-        use_slow_culling = False,
         verbosity=0,
         use_prior=True,
         num_priors=4,
         use_fast_rollout_eval=False,
-        use_fast_prune_eval=False
+        use_fast_prune_eval=False,
+        use_ml_leaf_eval=False,
+        cascade_size=CASCADE_SHORTLIST,
+        cascade_check=0,
+        scorer=static_move_scores,
+        expand_after=EXPANSION_VISITS,
+        leaf_batch=1,
+        rollout_pool=None,
+        seed=None
     ) -> Node:
     """
     Entry point for the Monte Carlo Tree Search. This could run for ever so either a timer or
     a maximum number of iterations must be used to provide a cutoff.
-    """
+
+    With use_ml_leaf_eval leaves are scored by the ML evaluation instead of rollouts, the
+    children of each expanded node are evaluated as one batch.
+
+    cascade_size is the number of moves per side that scorer shortlists before the outer_cutoff
+    best are found by evaluation (None to evaluate every move), cascade_check is the fraction of
+    prunings that are compared with evaluating every move, see CascadeStats.
+
+    A node other than the root is expanded once it has expand_after visits, until then rollouts
+    are made from it.
+
+    With a leaf_batch above 1 each iteration selects that many leaves, using virtual loss, and
+    rolls them out as one batch (see search_batch). The rollouts of a batch run in rollout_pool
+    if it is given, an object with a map method such as a multiprocessing Pool.
+
+    Runs search with a SearchContext of these settings.
+    """
+    if exploration_constant == 0:
+        exploration_constant = EXPLORATION_CONSTANT
+    context = SearchContext(
+        playout_amount=playout_amount,
+        outer_cutoff=outer_cutoff,
+        num_iterations=num_iterations,
+        turn_time=turn_time,
+        exploration_constant=exploration_constant,
+        verbosity=verbosity,
+        use_prior=use_prior,
+        num_priors=num_priors,
+        use_fast_rollout_eval=use_fast_rollout_eval,
+        use_fast_prune_eval=use_fast_prune_eval,
+        use_ml_leaf_eval=use_ml_leaf_eval,
+        cascade_size=cascade_size,
+        cascade_check=cascade_check,
+        scorer=scorer,
+        expand_after=expand_after,
+        leaf_batch=leaf_batch,
+        rollout_pool=rollout_pool,
+        seed=seed
+    )
+    return search(root, context)
 
 
-    global rollout_count, start_time, exp_constant, is_using_prior, num_prior_visits, \
-        is_using_fast_prune_eval, is_using_fast_rollout_eval
-    if exploration_constant != 0:
-        exp_constant=exploration_constant
-    start_time = time()
+def search(root: Node, context: SearchContext):
+    """
+    Search from the root until the context's time or iteration budget runs out and return the
+    chosen friend move
+    """
+    context.start_time = time()
     root.parent = None
-    is_using_prior = use_prior
-    num_prior_visits = num_priors
-    is_using_fast_rollout_eval = use_fast_rollout_eval
-    is_using_fast_prune_eval = use_fast_prune_eval
-    while (time() < start_time + turn_time and root.num_visits < num_iterations):
+    while context.has_budget(root):
+        if context.leaf_batch > 1:
+            search_batch(root, context)
+            continue
         # A leaf node of the current frontier, does not include nodes visited in the rollout stage
-        leaf = traverse(root, node_cutoff, outer_cutoff, verbosity, use_slow_culling)
+        leaf = traverse(root, context)
         # Make random moves to terminal and record the win, lose or draw score
-        simulation_result = rollout(leaf, playout_amount)
+        simulation_result = rollout(leaf, context)
         # Update all nodes in the appropriate branch with the simulation result (again, branch does
         # not include any nodes visited in rollout stage)
         back_propagate(leaf, simulation_result)
@@ -105,46 +225,53 @@ def monte_carlo_tree_search(
 
     
     # Out of all the children of the root node choose the best one (i.e. the most visited one)
-    friend_winner, enemy_winner, winning_node = choose_winner(root)
+    friend_winner, enemy_winner, winning_node = choose_winner(root, context.rng)
 
     if DEBUG_MODE:
-        print_stats(root, friend_winner, enemy_winner, winning_node)
+        print_stats(root, friend_winner, enemy_winner, winning_node, context)
 
-    if (verbosity >= 1):
+    if (context.verbosity >= 1):
         print(f"ITERATIONS: {root.num_visits}")
-        print(f"TIME: {time() - start_time}")
+        print(f"TIME: {time() - context.start_time}")
     
-    if (verbosity >= 2):
-        print_stats(root, friend_winner, enemy_winner, winning_node)
+    if (context.verbosity >= 2):
+        print_stats(root, friend_winner, enemy_winner, winning_node, context)
 
     return friend_winner
 
-def simple_reduction(root: Node):
-    add_children(root, 6)
+def simple_reduction(root: Node, context=None):
+    if context is None:
+        context = SearchContext()
+    add_children(root, context)
     fr_scores = []
     for i, _ in enumerate(root.matrix):
-        _, _, evaluation_score = sum_stats(root, i, is_row=True)
-        # scores.append(evaluation_score / len(root.matrix[0]))
-        fr_scores.append(evaluation_score)
+        score, _ = sum_stats(root, i, is_row=True)
+        fr_scores.append(score)
 
     en_scores = []
     for i, _ in enumerate(root.matrix[0]):
-        _, _, evaluation_score = sum_stats(root, i, is_row=False)
-        en_scores.append(evaluation_score)
+        score, _ = sum_stats(root, i, is_row=False)
+        en_scores.append(score)
 
     return root.friend_transitions[0]
 
-def print_stats(root: Node, friend_winner, enemy_winner, winning_node: Node):
+def print_stats(root: Node, friend_winner, enemy_winner, winning_node: Node, context: SearchContext):
     """
     Print various stats useful for debugging MCTS
     """
 
+    cascade_stats = context.cascade_stats
     print(f"* GLOBAL STATS")
     print(f"* ratio:            {root.q_value / root.num_visits}")
     print(f"* simulations:      {root.num_visits}")
-    print(f"* rollout states:   {rollout_count}")
-    print(f"* children:         {len(root.matrix) * len(root.matrix[0])}")
-    print(f"* Exploration constant: {exp_constant}")
+    print(f"* rollout states:   {context.rollout_count}")
+    print(f"* children:         {len(root.matrix) * len(root.matrix[0])}, "
+          + f"{sum(child is not None for row in root.matrix for child in row)} made")
+    print(f"* Exploration constant: {context.exp_constant}")
+    print(f"* move cache:       {GameState.move_cache.hits} hits / {GameState.move_cache.misses} misses")
+    print(f"* evaluation cache: {len(eval.evaluation_cache)} entries, {eval.evaluation_cache.hit_rate():.2f} hit rate")
+    print(f"* cascade:          {cascade_stats.evaluated}/{cascade_stats.candidates} moves evaluated, "
+          + f"top moves changed in {cascade_stats.changed}/{cascade_stats.checks} checks")
     print(f"* WINNER STATS")
     if winning_node.num_visits > 0:
         ratio = winning_node.q_value / winning_node.num_visits
@@ -153,44 +280,48 @@ def print_stats(root: Node, friend_winner, enemy_winner, winning_node: Node):
     
     print(f"* {winning_node.q_value:4} / {winning_node.num_visits:4}  "
           + f"{ratio:+.3f}"
-          + f"  friend: {friend_winner}  enemy: {enemy_winner}")
+          + f"  friend: {GameState.decode_move(friend_winner)}  enemy: {GameState.decode_move(enemy_winner)}")
 
     print(f"* CHILD STATS")
 
     print(f"* Score  | Visits | Ratio  |          Move")
     print(f"* -------+--------+--------+-----------------------------------")
     for i in range(len(root.matrix)):
-        row_score, row_visits, _ = sum_stats(root, i, is_row=True)
+        row_score, row_visits = sum_stats(root, i, is_row=True)
         if row_visits > 0:
             ratio = row_score / row_visits
         else:
             ratio = 0
-        print(f"* {row_score:+6} | {row_visits:+6} | {ratio:+.3f} | move: {root.friend_transitions[i]}")
+        print(f"* {row_score:+6} | {row_visits:+6} | {ratio:+.3f} | move: {GameState.decode_move(root.friend_transitions[i])}")
 
 
-def traverse(node: Node, node_cutoff, outer_cutoff, verbosity, use_slow_culling):
-    """
-    Starting at the main root, traverse the tree. Use the UCT value to decide which child to visit 
-    in each step. 
-    
-    Stop when a node is reached with children that have not been the root of a rollout.
-    Pick a chiled from which to apply a rollout from the unvisited children.
+def traverse(node: Node, context: SearchContext):
     """
+    Starting at the main root, traverse the tree. Use the UCT value of each row and column to
+    decide which child to visit in each step, expanding nodes on the way.
 
-    # Find a node that hasn't been fully expanded
-    while node.is_fully_expanded:
-        node = get_best_child(node)
+    Stop at a terminal node, at a child that is selected for the first time or at a node that has
+    fewer than expansion_visits visits. A child's state is only made when it is first selected,
+    so most of the matrix of an expanded node is never built.
+    """
 
-    if eval.goal_reward(node) is not None:
-        # Node is terminal
-        return node
-    else:
-        add_children(node, node_cutoff, outer_cutoff, verbosity, use_slow_culling)
+    while eval.goal_reward(node) is None:
+        if node.row_visits is None:
+            if node.parent is not None and node.num_visits < context.expansion_visits:
+                # Not visited often enough to be worth expanding, use it as the leaf
+                return node
+            add_children(node, context)
+        i, j = get_best_indices(node, context)
+        child = node.matrix[i][j]
+        if child is None:
+            return node.make_child(i, j)
+        node = child
 
-    return pick_unvisited_child(node)
+    # Node is terminal
+    return node
 
 
-def rollout(node: Node, playout_amount):
+def rollout(node: Node, context: SearchContext):
     """
     Recursively choose moves for both sides until a terminal state is reached.
     Once terminal state reached, return the score in relation to root.friend 
@@ -199,27 +330,120 @@ def rollout(node: Node, playout_amount):
     goal_reward = eval.goal_reward(node)
     if goal_reward is not None:
         return goal_reward
+    elif context.is_using_ml_leaf_eval:
+        return evaluate_state_ml(node)
     else:
-        game_state = rollout_policy(node)
-        while goal_reward is None:
-            if playout_amount == 0:
-                goal_reward = evaluate_state_ternary(game_state)
-                break
-            game_state = rollout_policy(game_state)
-            goal_reward = eval.goal_reward(game_state)
-            playout_amount -= 1
+        goal_reward, game_state = play_out(node, context)
+        if goal_reward is None:
+            goal_reward = evaluate_state_ternary(game_state, context)
     return goal_reward
 
-def evaluate_state_ternary(game_state: GameState):
+
+def play_out(node: Node, context: SearchContext):
+    """
+    Make the random plies of a rollout from a state that isn't terminal. Return the goal reward
+    if the game ended, otherwise None, and the state the plies ended on.
+    """
+    playout_amount = context.playout_amount
+    game_state = rollout_policy(node, context)
+    goal_reward = None
+    while playout_amount > 0:
+        game_state = rollout_policy(game_state, context)
+        goal_reward = eval.goal_reward(game_state)
+        if goal_reward is not None:
+            break
+        playout_amount -= 1
+    return goal_reward, game_state
+
+def search_batch(root: Node, context: SearchContext):
+    """
+    One leaf parallel iteration. Traverse the tree leaf_batch times, each leaf takes a virtual
+    loss on its branch so that the next traversals prefer other moves. The leaves are rolled out
+    together and the virtual losses are replaced by their results.
+    """
+    batch_size = min(context.leaf_batch, context.num_iterations - root.num_visits)
+    leaves = []
+    for _ in range(int(batch_size)):
+        leaf = traverse(root, context)
+        add_virtual_loss(leaf, 1)
+        leaves.append(leaf)
+
+    results = rollout_batch(leaves, context)
+    for leaf, result in zip(leaves, results):
+        add_virtual_loss(leaf, -1)
+        back_propagate(leaf, result)
+
+
+def add_virtual_loss(node: Node, sign):
+    """
+    Add (sign 1) or remove (sign -1) a visit that lost for the side choosing each move, on the
+    branch from node up to the root
+    """
+    while node is not None:
+        node.num_visits += sign
+        parent = node.parent
+        if parent is not None and node.i >= 0:
+            # A loss for the friend in the row and for the enemy in the column
+            parent.row_visits[node.i] += sign
+            parent.row_scores[node.i] -= sign * VIRTUAL_LOSS
+            parent.col_visits[node.j] += sign
+            parent.col_scores[node.j] += sign * VIRTUAL_LOSS
+        node = parent
+
+
+def rollout_batch(leaves, context: SearchContext):
+    """
+    The rollout result of each leaf. With a rollout pool each rollout runs in a worker,
+    otherwise the random plies are made here and the states they end on are evaluated together.
+    """
+    if context.rollout_pool is not None:
+        options = (context.playout_amount, context.is_using_fast_rollout_eval, context.is_using_ml_leaf_eval)
+        tasks = [(leaf.copy(), context.rng.randrange(2 ** 32), options) for leaf in leaves]
+        return context.rollout_pool.map(rollout_worker, tasks)
+
+    results = [eval.goal_reward(leaf) for leaf in leaves]
+    unfinished = [k for k, result in enumerate(results) if result is None]
+    if context.is_using_ml_leaf_eval:
+        scores = 2 * ml.evaluate_states(leaves[k] for k in unfinished) - 1
+        for k, score in zip(unfinished, scores.tolist()):
+            results[k] = score
+        return results
+
+    batch = eval.StateBatch(is_fast=context.is_using_fast_rollout_eval)
+    to_evaluate = []
+    for k in unfinished:
+        results[k], game_state = play_out(leaves[k], context)
+        if results[k] is None:
+            batch.add(game_state)
+            to_evaluate.append(k)
+    # The sign of each score, as evaluate_state_ternary
+    for k, score in zip(to_evaluate, np.sign(eval.evaluate_states(batch)).tolist()):
+        results[k] = int(score)
+    return results
+
+
+def rollout_worker(task):
+    """
+    Roll out a game state in a worker process of a rollout pool
+    """
+    game_state, seed, (playout_amount, use_fast_rollout_eval, use_ml_leaf_eval) = task
+    context = SearchContext(
+        playout_amount=playout_amount,
+        use_fast_rollout_eval=use_fast_rollout_eval,
+        use_ml_leaf_eval=use_ml_leaf_eval,
+        seed=seed
+    )
+    return rollout(game_state, context)
+
+
+def evaluate_state_ternary(game_state: GameState, context: SearchContext):
     """
     Return 
         +1  if evaluation function thinks a win is likely,
          0  if a draw is likely
         -1  if a lose is likely
     """
-    global is_using_fast_rollout_eval
-
-    if is_using_fast_rollout_eval:
+    if context.is_using_fast_rollout_eval:
         final_score = eval.evaluate_state_fast(game_state)
     else:
         final_score = eval.evaluate_state(game_state)
@@ -231,14 +455,20 @@ def evaluate_state_ternary(game_state: GameState):
         return -1
 
 
-def rollout_policy(game_state: "Node") -> GameState:
+def evaluate_state_ml(game_state: GameState):
+    """
+    Expected result of the game state in [-1, +1] from the ML evaluation's win probability
+    """
+    return 2 * ml.evaluate(game_state) - 1
+
+
+def rollout_policy(game_state: "Node", context: SearchContext) -> GameState:
     """
     Make random pair of moves (or use a very fast heuristic) and return the new state
     """
-    global rollout_count
-    rollout_count += 1
-    friend_choice = biased_random_move(game_state, is_friend=True)
-    enemy_choice = biased_random_move(game_state, is_friend=False)
+    context.rollout_count += 1
+    friend_choice = biased_random_move(game_state, is_friend=True, rng=context.rng)
+    enemy_choice = biased_random_move(game_state, is_friend=False, rng=context.rng)
     new_state = game_state.copy()
     new_state.update(friend_choice, enemy_choice)
     return new_state
@@ -250,8 +480,15 @@ def back_propagate(node: "Node", result):
     update the statistics for those nodes
     """
     update_stats(node, result)
-    if node.parent is not None:
-        back_propagate(node.parent, result)
+    parent = node.parent
+    if parent is not None:
+        if node.i >= 0:
+            # Keep the parent's row and column sums up to date
+            parent.row_visits[node.i] += 1
+            parent.row_scores[node.i] += result
+            parent.col_visits[node.j] += 1
+            parent.col_scores[node.j] += result
+        back_propagate(parent, result)
 
 
 def update_stats(node: Node, result):
@@ -269,54 +506,33 @@ def sum_stats(node: Node, index, is_row=True):
 
     is_row specifies whether it is a row
 
+    The sums are kept on the node by update_with_priors and back_propagate.
     """
-    score_sum = 0
-    visit_sum = 0
-    eval_sum = 0
     if is_row:
-        for j in range(len(node.matrix[0])):
-            curr_node: Node = node.matrix[index][j]
-            score_sum += curr_node.q_value
-            visit_sum += curr_node.num_visits
-            eval_sum += curr_node.evaluation_score
-    else:
-        for i in range(len(node.matrix)):
-            curr_node: Node = node.matrix[i][index]
-            score_sum += curr_node.q_value
-            visit_sum += curr_node.num_visits
-            eval_sum += curr_node.evaluation_score
-    return score_sum, visit_sum, eval_sum
+        return node.row_scores[index], node.row_visits[index]
+    return node.col_scores[index], node.col_visits[index]
 
 
+def random_argmax(values, rng=random):
+    """
+    Index of the largest value, ties are broken at random with rng
+    """
+    best = np.flatnonzero(values == values.max())
+    return best[rng.randrange(len(best))]
 
-def choose_winner(node: Node):
+
+def choose_winner(node: Node, rng=random):
     """
     Of all the children of node, choose the one with the best score. 
     Traditionally this is the one with the most visits.
     """
 
-    best_friend_visits = 0
-    best_enemy_visits = 0
-    best_i = 0
-    best_j = 0
-    row_indices = list(range(len(node.matrix)))
-    col_indices = list(range(len(node.matrix[0])))
-    shuffle(row_indices)
-    shuffle(col_indices)
-
-    for i in row_indices:
-        _, row_num_visits, _ = sum_stats(node, i, is_row=True)
-        if row_num_visits > best_friend_visits:
-            best_friend_visits = row_num_visits
-            best_i = i
-    
-    for j in col_indices:
-        _, col_num_visits, _ = sum_stats(node, j, is_row=False)
-        if row_num_visits > best_enemy_visits:
-            best_enemy_visits = col_num_visits
-            best_j = j
     try:
+        best_i = random_argmax(node.row_visits, rng)
+        best_j = random_argmax(node.col_visits, rng)
         winning_node = node.matrix[best_i][best_j]
+        if winning_node is None:
+            winning_node = node.make_child(best_i, best_j)
         friend_transition = node.friend_transitions[best_i]
         enemy_transition = node.enemy_transitions[best_j]
     except:
@@ -334,29 +550,7 @@ def choose_winner(node: Node):
     return friend_transition, enemy_transition, winning_node
 
 
-def pick_unvisited_child(node: "Node") -> Node:
-    """
-    From all the children of node, randomly choose one that has not been visited and return it.
-    Possible to use a heuristic here instead of randomness.
-    """
-
-    if is_using_prior:
-        unvisited = node.unvisited_children(num_prior_visits * 2)
-    else:
-        unvisited = node.unvisited_children()
-    # shuffle(unvisited)
-    num_unvisited = len(unvisited)
-    if num_unvisited == 0:
-        node.is_fully_expanded = True
-        return None
-    else:
-        choice = unvisited[randrange(num_unvisited)]
-        if num_unvisited == 1:
-            node.is_fully_expanded = True
-        return choice
-
-
-def get_best_child(node: Node):
+def get_best_indices(node: Node, context: SearchContext):
     """
     Choose best child.
 
@@ -365,127 +559,121 @@ def get_best_child(node: Node):
     UCT uses the sum of all scores and visits for a particular row / column instead of just the one 
     for a particular move.
 
-    When the best UCT score has been selected for both the friend and enemy, the corresponding
-    child is selected from the matrix.
+    Return the (row, column) of the child with the best UCT score for both the friend and enemy,
+    the child itself may not have been made yet.
 
-    Best UCT is the one with the highest value for the friend and lowest value for the enemy
+    Best UCT is the one with the highest value for the friend and lowest value for the enemy.
+    Rows and columns that have no visits (when there are no prior visits) are tried first.
     """
-    global exp_constant
-
-    # Best UCT for friend
-    best_uct_friend = float("-inf")
-    best_row_index = 0
-    row_indices = list(range(len(node.matrix)))
-    shuffle(row_indices)
-
-    for i in row_indices:
-        row_score_sum, row_visit_sum, _ = sum_stats(node, i, is_row=True)
-        uct = get_uct(node.num_visits, row_visit_sum, row_score_sum, exp_constant)
-        if uct > best_uct_friend:
-            best_uct_friend = uct
-            best_row_index = i
-    
-    # Best UCT for enemy
-    best_uct_enemy = float("inf")
-    best_col_index = 0
-    col_indices = list(range(len(node.matrix[0])))
-    shuffle(col_indices)
-
-    for j in col_indices:
-        col_score_sum, col_visit_sum, _ = sum_stats(node, j, is_row=False)
-        uct = get_uct(node.num_visits, col_visit_sum, col_score_sum, -exp_constant)
-        if uct < best_uct_enemy:
-            best_uct_enemy = uct
-            best_col_index = j
+    # UCT of every row and every column at once, best is highest for the friend and lowest for the
+    # enemy
+    # A node is first selected from before it has any visits of its own
+    parent_visits = max(node.num_visits, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        row_uct = get_uct(parent_visits, node.row_visits, node.row_scores, context.exp_constant)
+        col_uct = get_uct(parent_visits, node.col_visits, node.col_scores, -context.exp_constant)
+    row_uct[node.row_visits == 0] = np.inf
+    col_uct[node.col_visits == 0] = -np.inf
 
     # Final choice
-    return node.matrix[best_row_index][best_col_index]
+    return random_argmax(row_uct, context.rng), random_argmax(-col_uct, context.rng)
 
                 
 def get_uct(parent_visits, visits, score, c):
     """
-    Get the UCT score
+    Get the UCT score, visits and score can be arrays of the sums for each row or column
     """
 
     return score / visits + c * np.sqrt(np.log(parent_visits) / visits)
 
 
-def add_children(node: "Node", node_cutoff, outer_cutoff, verbosity, use_slow_culling):
+def add_children(node: "Node", context: SearchContext):
     """
     Calculate all friend and enemy moves that can be reached from the node state. 
     
-    Add them to the node matrix as children.
+    Keep the best of them as the rows and columns of the node matrix, with prior visits from their
+    pruning scores. The children themselves are made by Node.make_child when first selected.
     """
 
-    global is_using_prior
     if len(node.friend_transitions) == 0 and len(node.enemy_transitions) == 0:
 
         node.friend_transitions = node.next_friend_transitions()
         node.enemy_transitions = node.next_enemy_transitions()
         node.branching = len(node.friend_transitions) * len(node.enemy_transitions)
-        prune_transitions(node, outer_cutoff)
-        update_with_matrix_and_priors(node)
+        fr_scores, en_scores = prune_transitions(node, context)
+        update_with_priors(node, fr_scores, en_scores, context)
         
 
-def update_with_minimax(node: Node, outer_cutoff):
+def prune_transitions(node: Node, context: SearchContext):
     """
-    Use minimax to cull children.
-
+    Keep the outer_cutoff best moves of each side, each evaluated against the greedy reply of the
+    other side, and return the lists of their scores. With a cascade shortlist the static move
+    scorer first picks that many candidates per side and only those are evaluated, otherwise
+    every move is evaluated.
     """
-    minimax_tree = minimax_paranoid_reduction_tree(node)
-    minimax_tree_len = len(minimax_tree)
-    node.matrix = []
-    for i in range(min(outer_cutoff, minimax_tree_len)):
-        _, _, min_row = heappop(minimax_tree)
-        min_row_len = len(min_row)
-        node.branching = minimax_tree_len * min_row_len
-        matrix_row = []
-        for j in range(min(outer_cutoff, min_row_len)):
-            score_ij, _, node_ij = heappop(min_row)
-            node_ij.parent = node
-            update_priors(node_ij, score_ij)
-            matrix_row.append(node_ij)
-        node.matrix.append(matrix_row)
-
-
-def prune_transitions(node: Node, outer_cutoff):
-    fr_greedy_transition = eval.greedy_choose(node, is_friend=True)
-    en_greedy_transition = eval.greedy_choose(node, is_friend=False)
-
-    global is_using_fast_prune_eval
-    evaluate_state_function = eval.evaluate_state_fast if is_using_fast_prune_eval else eval.evaluate_state
+    cascade_shortlist = context.cascade_shortlist
+    outer_cutoff = context.outer_cutoff
+    cascade_stats = context.cascade_stats
 
     # Shuffle so that states with equal scores have equal chance of being picked
-    shuffle(node.friend_transitions)
-    shuffle(node.enemy_transitions)
+    context.rng.shuffle(node.friend_transitions)
+    context.rng.shuffle(node.enemy_transitions)
 
-    fr_scores = []
-    en_scores = []
+    if cascade_shortlist is None:
+        fr_candidates = node.friend_transitions
+        en_candidates = node.enemy_transitions
+    else:
+        fr_candidates = shortlist(node, node.friend_transitions, True, cascade_shortlist, context.move_scorer)
+        en_candidates = shortlist(node, node.enemy_transitions, False, cascade_shortlist, context.move_scorer)
+
+    fr_greedy_transition = eval.greedy_choose(node, is_friend=True, transitions=fr_candidates, rng=context.rng)
+    en_greedy_transition = eval.greedy_choose(node, is_friend=False, transitions=en_candidates, rng=context.rng)
+    fr_ranked = rank_transitions(node, fr_candidates, en_greedy_transition, True, context)[:outer_cutoff]
+    en_ranked = rank_transitions(node, en_candidates, fr_greedy_transition, False, context)[:outer_cutoff]
+
+    if cascade_shortlist is not None:
+        cascade_stats.prunings += 1
+        cascade_stats.candidates += len(node.friend_transitions) + len(node.enemy_transitions)
+        cascade_stats.evaluated += len(fr_candidates) + len(en_candidates)
+        if context.cascade_check_rate and context.rng.random() < context.cascade_check_rate:
+            # Rank every move against the same replies, the cascade changed the top moves if it
+            # missed one that scores better than one it kept
+            full_fr_ranked = rank_transitions(node, node.friend_transitions, en_greedy_transition, True, context)
+            full_en_ranked = rank_transitions(node, node.enemy_transitions, fr_greedy_transition, False, context)
+            cascade_stats.checks += 1
+            if ([score for score, _ in fr_ranked] != [score for score, _ in full_fr_ranked[:outer_cutoff]]
+                    or [score for score, _ in en_ranked] != [score for score, _ in full_en_ranked[:outer_cutoff]]):
+                cascade_stats.changed += 1
+
+    node.friend_transitions = [transition for _, transition in fr_ranked]
+    node.enemy_transitions = [transition for _, transition in en_ranked]
+    return [-1 * key for key, _ in fr_ranked], [key for key, _ in en_ranked]
+
+
+def rank_transitions(node: Node, transitions, reply, is_friend, context: SearchContext):
+    """
+    List of (key, transition) for the moves of a side, each applied with the other side's reply,
+    best first. The key is the negated score for the friend and the score for the enemy.
+    """
+    # Evaluate each move in place, in one batch
+    batch = eval.StateBatch(is_fast=context.is_using_fast_prune_eval)
+    for transition in transitions:
+        if is_friend:
+            undo_token = node.apply(transition, reply)
+        else:
+            undo_token = node.apply(reply, transition)
+        batch.add(node)
+        node.undo(undo_token)
+
+    keys = []
+    for i, score in enumerate(eval.evaluate_states(batch)):
+        if is_friend:
+            keys.append((-1 * score_with_repeated_state_check(node, score), i))
+        else:
+            keys.append((+1 * score, i))
+    keys.sort()
+    return [(key, transitions[i]) for key, i in keys]
 
-    for i, fr_transition in enumerate(node.friend_transitions):
-        state = node.copy()
-        state.update(fr_transition, en_greedy_transition)
-        score = score_with_repeated_state_check(node, evaluate_state_function(state))
-        heappush(fr_scores, (-1 * score, i))
-    
-    for j, en_transition in enumerate(node.enemy_transitions):
-        state = node.copy()
-        state.update(fr_greedy_transition, en_transition)
-        score = evaluate_state_function(state)
-        heappush(en_scores, (+1 * score, j))
-    
-    new_fr_transitions = []
-    new_en_transitions = []
-    for _i in range(min(outer_cutoff, len(fr_scores))):
-        _, fr_scores_index = heappop(fr_scores)
-        new_fr_transitions.append(node.friend_transitions[fr_scores_index])
-    for _j in range(min(outer_cutoff, len(en_scores))):
-        _, en_scores_index = heappop(en_scores)
-        new_en_transitions.append(node.enemy_transitions[en_scores_index])
-
-    node.friend_transitions = new_fr_transitions
-    node.enemy_transitions = new_en_transitions
-        
 
 def score_with_repeated_state_check(node: Node, score):
     new_score = score
@@ -498,139 +686,37 @@ def score_with_repeated_state_check(node: Node, score):
             score -= 500
     return score
 
-def prune_children(node: Node, node_cutoff):
+def update_with_priors(node: Node, fr_scores, en_scores, context: SearchContext):
     """
-    Use the evaluation function to prune the friend and enemy moves under consideration.
+    Set up the empty matrix of a node and the prior visits of its rows and columns. A row gets
+    num_prior_visits for each of its cells, with the score of its friend move against the greedy
+    enemy reply, and likewise for the columns.
     """
-    friend_scores = []
-    for i in range(len(node.matrix)):
-        _, _, row_score = sum_stats(node, i, is_row=True)
-        friend_scores.append((row_score, i))
+    num_prior_visits = context.num_prior_visits
+    num_rows = len(node.friend_transitions)
+    num_cols = len(node.enemy_transitions)
+    node.matrix = [[None] * num_cols for _ in range(num_rows)]
+    node.row_visits = np.full(num_rows, float(num_prior_visits * num_cols))
+    node.row_scores = np.tanh(np.array(fr_scores) * 0.005) * (num_prior_visits * num_cols)
+    node.col_visits = np.full(num_cols, float(num_prior_visits * num_rows))
+    node.col_scores = np.tanh(np.array(en_scores) * 0.005) * (num_prior_visits * num_rows)
 
-    enemy_scores = []
-    for j in range(len(node.matrix[0])):
-        _, _, col_score = sum_stats(node, j, is_row=False)
-        enemy_scores.append((col_score, j))
+    if context.is_using_ml_leaf_eval:
+        # Each child is a leaf when it is first selected, evaluate them together so that their
+        # leaf evaluations are cache hits
+        ml.evaluate_states(iter_children_in_place(node))
 
-    friend_scores.sort(reverse=True)
-    enemy_scores.sort(reverse=False)
-    friend_scores = friend_scores[:node_cutoff]
-    enemy_scores = enemy_scores[:node_cutoff]
-
-    new_fr_transitions = [node.friend_transitions[x] for _, x in friend_scores]
-    new_en_transitions = [node.enemy_transitions[x] for _, x in enemy_scores]
-
-    new_matrix = [
-        [
-            node.matrix[i][j] for _, j in enemy_scores
-        ]
-        for _, i in friend_scores
-    ]
-    
-    node.friend_transitions = new_fr_transitions
-    node.enemy_transitions = new_en_transitions
-    node.matrix = new_matrix
-
-
-def update_with_matrix(node: Node):
-    node.matrix = []
-    for i in range(len(node.friend_transitions)):
-        row = []
-        for j in range(len(node.enemy_transitions)):
-            updated_node = node.copy_node_state()
-            updated_node.update(node.friend_transitions[i], node.enemy_transitions[j])
-            updated_node.parent = node
-            row.append(updated_node)
-        node.matrix.append(row)
-
-
-def update_with_matrix_and_priors(node: Node):
-    node.matrix = []
-    global is_using_fast_prune_eval
-    evaluate_state_function = eval.evaluate_state_fast if is_using_fast_prune_eval else eval.evaluate_state
-
-    for i in range(len(node.friend_transitions)):
-        row = []
-        for j in range(len(node.enemy_transitions)):
-            updated_node = node.copy_node_state()
-            updated_node.update(
-                node.friend_transitions[i], node.enemy_transitions[j])
-            updated_node.parent = node
-            updated_node_score = evaluate_state_function(updated_node)
-            update_priors(updated_node, updated_node_score)
-            row.append(updated_node)
-        node.matrix.append(row)
-
-def update_priors(node: Node, score):
-    global num_prior_visits
-    tanh_score = np.tanh(score*0.005)
-    node.num_visits = num_prior_visits
-    node.q_value = tanh_score * num_prior_visits
-    return
-
-def update_with_pruned_matrix(node: Node, node_cutoff):
-
-    fr_scores, en_scores = __get_prune_scores_slow(node)
-
-    node.matrix = []
-    new_fr_transitions = []
-    new_en_transitions = []
-    for i in range(min(node_cutoff, len(node.friend_transitions))):
-        _, fr_tr_index = heappop(fr_scores)
-        new_fr_transitions.append(node.friend_transitions[fr_tr_index])
-
-        row = []
-        for j in range(min(node_cutoff, len(node.enemy_transitions))):
-            if i == 0:
-                _, en_tr_index = heappop(en_scores)
-                new_en_transitions.append(node.enemy_transitions[en_tr_index])
-            updated_node = node.copy_node_state()
-            updated_node.update(new_fr_transitions[i], new_en_transitions[j])
-            updated_node.parent = node
-            row.append(updated_node)
-        node.matrix.append(row)
-
-    node.friend_transitions = new_fr_transitions
-    node.enemy_transitions = new_en_transitions
-
-
-def __get_prune_scores_slow(node: Node):
-    return (
-        __get_prune_scores_slow_for_side(node, is_friend=True),
-        __get_prune_scores_slow_for_side(node, is_friend=False)
-    )
 
-
-def __get_prune_scores_slow_for_side(node: Node, is_friend):
-    ref_transitions = node.friend_transitions if is_friend else node.enemy_transitions
-    multiplier = -1 if is_friend else 1
-    scores = []
-    global is_using_fast_prune_eval
-    evaluate_state_function = eval.evaluate_state_fast if is_using_fast_prune_eval else eval.evaluate_state
-
-    for i, ref_transition in enumerate(ref_transitions):
-        updated_node = node.copy_node_state()
-        if is_friend:
-            temp_node = node.copy_node_state()
-            temp_node.update(friend_transition=ref_transition)
-            opp_transition = eval.greedy_choose(node, is_friend=False)
-            updated_node.update(ref_transition, opp_transition)
-        else:
-            temp_node = node.copy_node_state()
-            temp_node.update(enemy_transition=ref_transition)
-            opp_transition = eval.greedy_choose(node, is_friend=True)
-            updated_node.update(opp_transition, ref_transition)
-        score = evaluate_state_function(updated_node)
-        if is_friend:
-            if updated_node.existing_moves.limit_is_close:
-                score -= 500
-            if updated_node.existing_moves.limit_reached:
-                if score > 0:
-                    score-= 10000
-                else:
-                    score -= 500        
-        heappush(scores, (multiplier * score, i))
-    return scores
+def iter_children_in_place(node: Node):
+    """
+    Apply each (row, column) pair of moves to the node in place and yield it, undoing the moves
+    when the next one is asked for
+    """
+    for fr_transition in node.friend_transitions:
+        for en_transition in node.enemy_transitions:
+            undo_token = node.apply(fr_transition, en_transition)
+            yield node
+            node.undo(undo_token)
 
 
 def sigmoid(x, b):
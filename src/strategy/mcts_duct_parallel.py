@@ -0,0 +1,113 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+
+Root parallel DUCT
+
+Runs independent DUCT searches from the same root in worker processes, each with its own seed,
+and merges the visits and scores of their root rows and columns before the winner is chosen.
+Each worker process searches with its own SearchContext and keeps its own move and evaluation
+caches, which stay warm between turns.
+"""
+
+from multiprocessing import Pool
+from random import randrange
+import numpy as np
+from state.node_mcts_duct import Node
+import strategy.mcts_duct as mcts_duct
+
+# Kept between turns, starting the worker processes takes longer than a short search
+pool = None
+pool_size = 0
+
+
+def get_pool(num_workers):
+    global pool, pool_size
+    if pool is None or pool_size != num_workers:
+        close_pool()
+        pool = Pool(num_workers)
+        pool_size = num_workers
+    return pool
+
+
+def close_pool():
+    global pool, pool_size
+    if pool is not None:
+        pool.terminate()
+        pool = None
+        pool_size = 0
+
+
+def root_parallel_search(root: Node, num_workers=2, seed=None, **search_options):
+    """
+    Run num_workers searches from the root, each with a SearchContext of the search_options (so
+    turn_time and num_iterations are per worker), and return the friend move with the most visits
+    over all of them.
+
+    The root's rows and columns are replaced by the merged ones, it has no children afterwards,
+    so the subtree kept from the last turn is dropped.
+    """
+    if seed is None:
+        seed = randrange(2 ** 32)
+    game_state = root.copy()
+    tasks = [(game_state, seed + k, search_options) for k in range(num_workers)]
+    merge_root_statistics(root, get_pool(num_workers).map(search_worker, tasks))
+
+    friend_winner, _, _ = mcts_duct.choose_winner(root)
+    return friend_winner
+
+
+def search_worker(task):
+    """
+    Search from a game state in a worker process and return the root statistics, as used by
+    merge_root_statistics
+    """
+    game_state, seed, search_options = task
+    root = Node(game_state)
+    mcts_duct.search(root, mcts_duct.SearchContext(seed=seed, **search_options))
+    return (
+        root.friend_transitions, root.enemy_transitions,
+        root.row_visits, root.row_scores, root.col_visits, root.col_scores, root.num_visits, root.q_value,
+        root.branching
+    )
+
+
+def merge_root_statistics(root: Node, results):
+    """
+    Sum the visits and scores of each friend and enemy move, and the visits and score of the root,
+    over the root statistics of several searches, the moves kept by each search's pruning can
+    differ. Workers whose root wasn't expanded (the game is over) are skipped.
+
+    The root's branching is set to the number of move pairs before pruning, which every worker
+    counts from the same state.
+    """
+    friend_stats = {}
+    enemy_stats = {}
+    root.num_visits = 0
+    root.q_value = 0
+    for (friend_transitions, enemy_transitions, row_visits, row_scores, col_visits, col_scores,
+            num_visits, q_value, branching) in results:
+        if row_visits is None:
+            continue
+        root.num_visits += num_visits
+        root.q_value += q_value
+        root.branching = branching
+        for transition, visits, score in zip(friend_transitions, row_visits, row_scores):
+            stats = friend_stats.setdefault(transition, [0.0, 0.0])
+            stats[0] += visits
+            stats[1] += score
+        for transition, visits, score in zip(enemy_transitions, col_visits, col_scores):
+            stats = enemy_stats.setdefault(transition, [0.0, 0.0])
+            stats[0] += visits
+            stats[1] += score
+
+    root.friend_transitions = list(friend_stats)
+    root.enemy_transitions = list(enemy_stats)
+    root.matrix = [[None] * len(enemy_stats) for _ in friend_stats]
+    root.row_visits = np.array([visits for visits, _ in friend_stats.values()])
+    root.row_scores = np.array([score for _, score in friend_stats.values()])
+    root.col_visits = np.array([visits for visits, _ in enemy_stats.values()])
+    root.col_scores = np.array([score for _, score in enemy_stats.values()])
@@ -2,7 +2,7 @@ import math
 import copy
 import random
 from state.game_state import GameState
-from strategy.evaluation import evaluate_state, evaluate_state_fast
+from strategy.evaluation import StateBatch, evaluate_states
 from heapq import heappush
 from state.node_mcts_duct import Node
 
@@ -36,14 +36,13 @@ def build_state_tree_fast(game_state: GameState):
     for f_move in f_moves:
 
         eval_offset = repeated_state_offset(game_state, f_move)
-        min_score = float("inf")
 
+        batch = StateBatch()
         for e_move in e_moves:
-            game_state_ij = game_state.copy()
-            game_state_ij.update(f_move, e_move)
-            eval_score = evaluate_state(game_state_ij)
-            if eval_score < min_score:
-                min_score = eval_score
+            undo_token = game_state.apply(f_move, e_move)
+            batch.add(game_state)
+            game_state.undo(undo_token)
+        min_score = evaluate_states(batch).min()
 
         if min_score + eval_offset > max_score :
             max_score = min_score + eval_offset
@@ -71,11 +70,15 @@ def build_state_tree(game_state: GameState):
 
     for f_move in f_moves:
         eval_offset = repeated_state_offset(game_state, f_move)
-        min_row = []
+        batch = StateBatch(is_fast=True)
+        row_states = []
         for e_move in e_moves:
             game_state_ij = game_state.copy()
             game_state_ij.update(f_move, e_move)
-            eval_score = evaluate_state_fast(game_state_ij)
+            batch.add(game_state_ij)
+            row_states.append(game_state_ij)
+        min_row = []
+        for eval_score, e_move, game_state_ij in zip(evaluate_states(batch), e_moves, row_states):
             heappush(min_row, (eval_score, e_move, Node(game_state_ij)))
         min_score, _, _ = min_row[0]
         # push negative of score so that heappop will return the actual max score
@@ -85,11 +88,13 @@ def build_state_tree(game_state: GameState):
 
 
 def repeated_state_offset(game_state: GameState, fr_transition):
-    temp_state = game_state.copy()
-    temp_state.update(fr_transition)
-    if temp_state.existing_moves.limit_is_close:
+    undo_token = game_state.apply(fr_transition)
+    limit_is_close = game_state.existing_moves.limit_is_close
+    limit_reached = game_state.existing_moves.limit_reached
+    game_state.undo(undo_token)
+    if limit_is_close:
         return -400
-    elif temp_state.existing_moves.limit_reached:
+    elif limit_reached:
         return -2000
     else:
         return 0
@@ -9,7 +9,7 @@ Kevin Russell 1084088
 from state.game_state import GameState
 import numpy as np
 from numpy.random import choice
-from strategy.evaluation import evaluate_state
+from strategy.evaluation import evaluate_state, evaluate_states, StateBatch, IncrementalEvaluator
 from strategy.nash import solve_game
 from strategy.evaluation import goal_reward
 
@@ -98,13 +98,12 @@ def __row_scores(game_state: GameState, fr_transition, en_transitions):
     Return a row of evaluation scores.
     """
 
-    row = []
+    batch = StateBatch()
     for en_transition in en_transitions:
-        curr_state = game_state.copy()
-        curr_state.update(fr_transition, en_transition)
-        score = evaluate_state(curr_state)
-        row.append(score)
-    return row
+        undo_token = game_state.apply(fr_transition, en_transition)
+        batch.add(game_state)
+        game_state.undo(undo_token)
+    return evaluate_states(batch).tolist()
 
 
 def __row_scores_recursive(
@@ -121,17 +120,18 @@ def __row_scores_recursive(
     #       then pick the top N scores and only do the recursive step on those
 
     row = []
+    evaluator = IncrementalEvaluator()
     for en_transition in en_transitions:
-        curr_state = game_state.copy()
-        curr_state.update(fr_transition, en_transition)
-        curr_score = evaluate_state(curr_state)
+        undo_token = game_state.apply(fr_transition, en_transition)
+        curr_score = evaluator.evaluate(game_state)
         if curr_score > best_score:
             # Best score needs to be updated
             best_score = curr_score
         if curr_score > best_score - cutoff_range:
             # The best score is within range of the best score, make a new level and evaluate
-            next_fr_transitions = curr_state.next_friend_transitions()
+            next_fr_transitions = game_state.next_friend_transitions()
             _, curr_score = __evaluate_equilibrium_recursive(
-                curr_state, next_fr_transitions, depth-1, cutoff_range)
+                game_state, next_fr_transitions, depth-1, cutoff_range)
+        game_state.undo(undo_token)
         row.append(curr_score)
     return row, best_score
\ No newline at end of file
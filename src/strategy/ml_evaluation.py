@@ -1,7 +1,7 @@
 import numpy as np
 from math import exp
-from state import game_state
-from strategy.evaluation_features import EvaluationFeatures
+from strategy.evaluation_features import NUM_ML_FEATURES, write_ml_features
+from strategy.evaluation_cache import EvaluationCache, evaluation_cache, ML_EVALUATE
 
 logistic_coefs = np.array([-1.53957804e+00, -3.95491844e-01, -6.25767776e-02,
         -3.51937374e-01,  1.77480062e-03,  7.23573021e-02,
@@ -13,12 +13,48 @@ logistic_coefs = np.array([-1.53957804e+00, -3.95491844e-01, -6.25767776e-02,
 
 logistic_inter = 0.4032599
 
-e = EvaluationFeatures()
+# The logistic coefficients are the weights of the features, in the order of ML_FEATURE_NAMES
 
 def evaluate(game_state):
-    e.calculate_features(game_state)
+    return evaluation_cache.evaluate(ML_EVALUATE, game_state, uncached_evaluate)
 
-    raw = np.array(e.to_vector()).dot(logistic_coefs) + logistic_inter
+def uncached_evaluate(game_state):
+    # The row belongs to this call, so searches in different threads don't share it
+    feature_row = np.empty(NUM_ML_FEATURES)
+    write_ml_features(game_state, feature_row)
+    raw = feature_row.dot(logistic_coefs) + logistic_inter
 
     return 1 / (1 + exp(-raw))
 
+def evaluate_states(game_states):
+    """
+    Array of the win probability of each game state. The states that aren't cached are evaluated
+    together, with one matrix vector product over their feature rows.
+
+    game_states can be any iterable. Each state is read before the next one is taken, so it can
+    yield a single state that is changed in place.
+    """
+    feature_rows = np.empty((64, NUM_ML_FEATURES))
+    scores = []
+    missing = []
+    for k, game_state in enumerate(game_states):
+        key = EvaluationCache.key(ML_EVALUATE, game_state)
+        score = evaluation_cache.get(key)
+        if score is None:
+            if len(missing) == len(feature_rows):
+                feature_rows = np.concatenate((feature_rows, np.empty_like(feature_rows)))
+            write_ml_features(game_state, feature_rows[len(missing)])
+            missing.append((k, key))
+            score = 0.0
+        scores.append(score)
+    scores = np.array(scores)
+    if not missing:
+        return scores
+
+    rows = feature_rows[:len(missing)]
+    new_scores = 1 / (1 + np.exp(-(rows @ logistic_coefs + logistic_inter)))
+
+    for (k, key), score in zip(missing, new_scores):
+        scores[k] = score
+        evaluation_cache.put(key, float(score))
+    return scores
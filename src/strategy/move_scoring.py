@@ -0,0 +1,87 @@
+"""
+COMP30024 Artificial Intelligence
+Semester 1, 2021
+Project Part B
+David Peel 964682
+Kevin Russell 1084088
+
+Static move scoring
+
+Scores a move from table lookups on the current bitboards, without applying it or evaluating the
+resulting state. It is much less accurate than the evaluation function, so it is only used to
+shortlist the candidates that the evaluation function then ranks.
+"""
+
+from heapq import nlargest
+from state.game_state import GameState
+from state.bitboard import popcount
+from state.move import THROW, SYMBOL_SHIFT, ORIGIN_SHIFT, DESTINATION_SHIFT, INDEX_MASK
+from state.token import DEFEATS, DEFEATED_BY
+
+# Weights of (captures, own tokens defeated, suicide, threats, dangers, distance to prey, throw),
+# roughly in proportion to the evaluate_state weights of the features the move changes
+STATIC_MOVE_WEIGHTS = (20, 20, 20, 2.5, 2.5, 1, 3)
+
+
+def static_move_scores(game_state: GameState, transitions, is_friend, weights=STATIC_MOVE_WEIGHTS):
+    """
+    Score each packed move of a side, higher is better for that side.
+
+    A move scores for the opponent tokens it defeats on its destination and loses for the side's
+    own tokens it defeats there and for landing on a token that defeats it. It scores for the
+    change in the number of neighbouring opponents the token threatens, loses for the change in
+    the number of neighbours that threaten it and loses for its distance to the nearest opponent
+    it defeats. Throws lose the cost of putting another token on the board.
+    """
+    capture, friendly_fire, suicide, threat, danger, approach, throw = weights
+    slide_masks = GameState.board.slide_masks
+    boards = game_state.boards
+    base, opponent_base = (0, 3) if is_friend else (3, 0)
+
+    # Per symbol lookups, a symbol's prey and predators don't depend on the move
+    prey_planes = [opponent_base + DEFEATS[symbol] for symbol in range(3)]
+    fields = [game_state.distance_field(plane) if boards[plane] else None for plane in prey_planes]
+
+    scores = []
+    for move in transitions:
+        destination = move >> DESTINATION_SHIFT
+        if move & 3 == THROW:
+            symbol = move >> SYMBOL_SHIFT & 3
+            neighbours = 0
+            score = -throw
+        else:
+            origin = move >> ORIGIN_SHIFT & INDEX_MASK
+            symbol = game_state.symbol_at(is_friend, origin)
+            neighbours = slide_masks[origin]
+            score = 0
+        prey = boards[prey_planes[symbol]]
+        predators = boards[opponent_base + DEFEATED_BY[symbol]]
+        bit = 1 << destination
+
+        if prey & bit:
+            score += capture * game_state.count_at(prey_planes[symbol], destination)
+        if boards[base + DEFEATS[symbol]] & bit:
+            score -= friendly_fire * game_state.count_at(base + DEFEATS[symbol], destination)
+        if predators & bit:
+            score -= suicide
+
+        # Change in the threats to and from the token's neighbours, from its origin to its destination
+        destination_neighbours = slide_masks[destination]
+        score += threat * (popcount(destination_neighbours & prey) - popcount(neighbours & prey))
+        score -= danger * (popcount(destination_neighbours & predators) - popcount(neighbours & predators))
+        if fields[symbol] is not None:
+            score -= approach * GameState.field_distance(fields[symbol], destination)
+        scores.append(score)
+    return scores
+
+
+def shortlist(game_state: GameState, transitions, is_friend, size, scorer=static_move_scores):
+    """
+    The size best moves of a side by scorer(game_state, transitions, is_friend), in order of
+    score. Moves with equal scores keep their order in transitions.
+    """
+    if len(transitions) <= size:
+        return list(transitions)
+    scores = scorer(game_state, transitions, is_friend)
+    best = nlargest(size, range(len(transitions)), key=scores.__getitem__)
+    return [transitions[k] for k in best]
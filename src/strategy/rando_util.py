@@ -5,7 +5,7 @@ Project Part B
 David Peel 964682
 Kevin Russell 1084088
 """
-from random import randrange, random
+import random
 from state.game_state import GameState
 
 
@@ -14,12 +14,13 @@ def random_move(state: GameState):
     Randomly chooses a transitions from all possible
     """
     transitions = state.next_friend_transitions()
-    return transitions[randrange(len(transitions))]
+    return transitions[random.randrange(len(transitions))]
 
-def biased_random_move(state: GameState, is_friend: bool):
+def biased_random_move(state: GameState, is_friend: bool, rng=random):
     """
     Randomly chooses a transition but favours moving rather than throwing,
     if there are 3 current player tokens on the board, throwing is discouraged even more.
+    The choices are made with rng, a random.Random or the random module.
     """
 
     move_transitions = state.next_swing_slide_transitions(is_friend)
@@ -29,12 +30,12 @@ def biased_random_move(state: GameState, is_friend: bool):
     if len(throw_transitions) == 0 and len(move_transitions) == 0:
         return None    
     if len(throw_transitions) == 0:
-        return move_transitions[randrange(len(move_transitions))]
+        return move_transitions[rng.randrange(len(move_transitions))]
     elif len(move_transitions) == 0:
-        return throw_transitions[randrange(len(throw_transitions))]
+        return throw_transitions[rng.randrange(len(throw_transitions))]
     else:
         throw_probability = 0.3 if num_on_board < 3 else 0.01
-        if random() < throw_probability:
-            return throw_transitions[randrange(len(throw_transitions))]
+        if rng.random() < throw_probability:
+            return throw_transitions[rng.randrange(len(throw_transitions))]
         else:
-            return move_transitions[randrange(len(move_transitions))]
+            return move_transitions[rng.randrange(len(move_transitions))]
@@ -0,0 +1,195 @@
+from state.game_state import GameState
+from strategy.evaluation import IncrementalEvaluator, StateBatch, evaluate_state, evaluate_state_fast, evaluate_states, goal_reward
+from strategy.evaluation_cache import evaluation_cache, EVALUATE_STATE, EVALUATE_STATE_FAST
+from strategy.evaluation import EVALUATE_STATE_FEATURES, EVALUATE_STATE_WEIGHTS, FAST_FEATURES, FAST_WEIGHTS
+from strategy.evaluation_features import EvaluationFeatures, ML_FEATURE_NAMES, NUM_ML_FEATURES, write_ml_features
+import strategy.ml_evaluation as ml
+from strategy.move_scoring import shortlist, static_move_scores
+import numpy as np
+from strategy.features import FeaturePlan
+
+
+def encoded(*transitions):
+    return [GameState.encode_move(transition) for transition in transitions]
+
+
+def test_batch_scores_match_single_scores():
+    """
+    evaluate_states scores every child the same as evaluate_state, including finished games
+    """
+    states = [
+        GameState(
+            friend_throws=3, enemy_throws=2,
+            friends={(0, 0): ['r'], (1, 0): ['p', 'p']}, enemies={(0, 1): ['s'], (-2, 1): ['r']}),
+        # the enemy has no throws left and only tokens that the friend rock can't defeat
+        GameState(friend_throws=9, enemy_throws=9, friends={(0, 0): ['r']}, enemies={(2, 0): ['p']}),
+        GameState(friend_throws=9, enemy_throws=9, friends={(0, 0): ['s']}, enemies={(2, 0): ['p']}),
+        GameState(friend_throws=2, enemy_throws=9, friends={(0, 0): ['r'], (1, 0): ['s']}),
+    ]
+    for state in states:
+        for is_fast, evaluate in ((False, evaluate_state), (True, evaluate_state_fast)):
+            batch = StateBatch(is_fast=is_fast)
+            expected = []
+            for friend_move, enemy_move in state.next_transitions():
+                undo_token = state.apply(friend_move, enemy_move)
+                batch.add(state)
+                expected.append(evaluate(state))
+                state.undo(undo_token)
+            assert list(evaluate_states(batch)) == expected
+
+
+def test_batch_scores_match_single_scores_with_custom_weights():
+    """
+    The disabled throw range and safe line features score 0 in both paths, whatever their weights
+    """
+    weights = (10, 200, -15, -30, -25, -25, -3, 500)
+    state = GameState(
+        friend_throws=3, enemy_throws=2,
+        friends={(0, 0): ['r'], (1, 0): ['p', 'p'], (3, -1): ['s']}, enemies={(0, 1): ['s'], (-2, 1): ['r']})
+    batch = StateBatch(use_cache=False)
+    expected = []
+    evaluator = IncrementalEvaluator(weights)
+    for friend_move, enemy_move in state.next_transitions():
+        undo_token = state.apply(friend_move, enemy_move)
+        batch.add(state)
+        expected.append(evaluate_state(state, weights))
+        assert evaluator.evaluate(state) == expected[-1]
+        state.undo(undo_token)
+    assert list(evaluate_states(batch, weights)) == expected
+
+
+def test_batch_of_copies():
+    state = GameState(friends={(0, 0): ['r']}, enemies={(0, 1): ['s']})
+    copied = state.copy()
+    copied.update(*encoded(('SLIDE', (0, 0), (0, 1)), ('THROW', 'p', (-4, 2))))
+    assert list(evaluate_states(StateBatch([state, copied]))) == [evaluate_state(state), evaluate_state(copied)]
+
+
+def test_incremental_evaluator_matches_full_evaluation():
+    """
+    Components reused between siblings give the same scores, including after battles
+    """
+    state = GameState(
+        friend_throws=4, enemy_throws=3,
+        friends={(0, 0): ['r'], (0, 1): ['p'], (1, 0): ['s', 's']},
+        enemies={(0, 2): ['s'], (-1, 1): ['r'], (2, -1): ['p']})
+    evaluator = IncrementalEvaluator()
+    for friend_move, enemy_move in state.next_transitions():
+        undo_token = state.apply(friend_move, enemy_move)
+        assert evaluator.evaluate(state) == evaluate_state(state)
+        assert evaluator.evaluate_fast(state) == evaluate_state_fast(state)
+        state.undo(undo_token)
+
+
+def test_evaluation_cache_is_keyed_by_position():
+    evaluation_cache.clear()
+    state = GameState(friends={(0, 0): ['r']}, enemies={(0, 2): ['s']})
+    score = evaluate_state(state)
+    # The same position reached in another game state is found in the cache
+    transposed = GameState(friends={(0, 0): ['r']}, enemies={(0, 2): ['s']})
+    assert evaluate_state(transposed) == score
+    assert evaluation_cache.hits[EVALUATE_STATE] == 1
+    # Fast scores and batches share the cache but fast scores are kept separately
+    evaluate_state_fast(state)
+    assert evaluation_cache.misses[EVALUATE_STATE_FAST] == 1
+    batch = StateBatch([state])
+    assert list(evaluate_states(batch)) == [score]
+    assert evaluation_cache.hits[EVALUATE_STATE] == 2
+    # A position repeated up to the limit can end the game, so it has its own entry
+    state.existing_moves.limit_reached = True
+    evaluate_state(state)
+    assert evaluation_cache.misses[EVALUATE_STATE] == 2
+
+
+def test_feature_plan_skips_unweighted_features():
+    plan = FeaturePlan.for_weights(EVALUATE_STATE_FEATURES, EVALUATE_STATE_WEIGHTS)
+    assert 'pieces_in_throw_range' not in plan.names and 'distance_from_safeline' not in plan.names
+    assert plan.intermediates == ('killable_distances', 'move_reach')
+    assert FeaturePlan.for_weights(FAST_FEATURES, FAST_WEIGHTS).intermediates == ('killable_distances',)
+
+
+def test_ml_features_from_bitboards():
+    state = GameState(
+        friend_throws=2, enemy_throws=1,
+        friends={(0, 0): ['r'], (0, 1): ['p', 'p']}, enemies={(0, 2): ['r'], (1, 0): ['s']})
+    features = EvaluationFeatures()
+    features.calculate_features(state)
+    # the rock can slide on to the scissors, the papers can slide on to the rock and the rock can
+    # swing over the papers on to the enemy rock, which it doesn't defeat
+    assert features.friend_count_kill_from_non_throw == 2
+    assert features.enemy_count_kill_from_non_throw == 1
+    assert features.friend_has_stack and not features.enemy_has_stack
+    assert features.death_diff == (2 - 3) - (1 - 2)
+
+
+def test_goal_reward_is_memoised_until_the_state_changes():
+    state = GameState(friend_throws=9, enemy_throws=9, friends={(0, 0): ['r']}, enemies={(1, 0): ['s'], (2, 0): ['s']})
+    assert goal_reward(state) is None  # the friend rock can't be defeated but there are two enemies
+    assert state.goal is None
+    undo_token = state.apply(*encoded(('SLIDE', (0, 0), (1, 0)), ('SLIDE', (2, 0), (2, -1))))
+    assert state.goal == GameState.GOAL_UNKNOWN
+    assert goal_reward(state) == 1
+    state.undo(undo_token)
+    assert state.goal is None
+    state.friends = {(0, 0): ['p']}
+    assert goal_reward(state) == -1
+
+
+def test_ml_feature_rows_match_the_attributes_and_batch_matches_single():
+    state = GameState(
+        friend_throws=3, enemy_throws=2,
+        friends={(0, 0): ['r'], (1, 0): ['p', 'p']}, enemies={(0, 1): ['s'], (-2, 1): ['r']})
+    children = []
+    for friend_move, enemy_move in state.next_transitions():
+        child = state.copy()
+        child.update(friend_move, enemy_move)
+        children.append(child)
+
+    row = np.empty(NUM_ML_FEATURES)
+    features = EvaluationFeatures()
+    for child in children:
+        write_ml_features(child, row)
+        features.calculate_features(child)
+        assert list(row) == [getattr(features, name) for name in ML_FEATURE_NAMES]
+
+    evaluation_cache.clear()
+    scores = ml.evaluate_states(children)
+    assert np.allclose(scores, [ml.uncached_evaluate(child) for child in children])
+    assert ml.evaluate(children[0]) == scores[0]  # cached by the batch
+
+
+def test_static_scores_shortlist_captures_first():
+    state = GameState(friends={(0, 0): ['r']}, enemies={(0, 1): ['s'], (1, -1): ['p']})
+    capture, suicide = encoded(('SLIDE', (0, 0), (0, 1)), ('SLIDE', (0, 0), (1, -1)))
+    transitions = state.next_friend_transitions()
+    scores = dict(zip(transitions, static_move_scores(state, transitions, True)))
+    assert scores[capture] == max(scores.values())
+    assert scores[suicide] == min(scores.values())
+    assert shortlist(state, transitions, True, 1) == [capture]
+    assert len(shortlist(state, transitions, True, len(transitions) + 1)) == len(transitions)
+
+
+def test_ml_evaluation_from_several_threads():
+    """
+    Threads evaluating different states don't share feature rows, so each cached score is the
+    score of its own state
+    """
+    from threading import Thread
+    state = GameState(
+        friend_throws=3, enemy_throws=2,
+        friends={(0, 0): ['r'], (1, 0): ['p', 'p']}, enemies={(0, 1): ['s'], (-2, 1): ['r']})
+    children = []
+    for friend_move, enemy_move in state.next_transitions():
+        child = state.copy()
+        child.update(friend_move, enemy_move)
+        children.append(child)
+
+    evaluation_cache.clear()
+    threads = [Thread(target=ml.evaluate_states, args=(children[k::4],)) for k in range(4)]
+    threads += [Thread(target=lambda: [ml.evaluate(child) for child in reversed(children)])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for child in children:
+        assert np.isclose(ml.evaluate(child), ml.uncached_evaluate(child))
@@ -0,0 +1,222 @@
+from state.game_state import GameState, ExistingMoves
+
+
+def sorted_stacks(stacks):
+    return {loc: sorted(tokens) for loc, tokens in stacks.items()}
+
+
+def encoded(*transitions):
+    return [GameState.encode_move(transition) for transition in transitions]
+
+
+def test_dict_views_round_trip():
+    """
+    Stacks given as dicts are stored in the bitboards and read back unchanged
+    """
+    state = GameState(
+        friends={(0, 0): ['r', 'r'], (4, -2): ['p']},
+        enemies={(-4, 2): ['s'], (0, 0): ['r']}
+    )
+    assert sorted_stacks(state.friends) == {(0, 0): ['r', 'r'], (4, -2): ['p']}
+    assert sorted_stacks(state.enemies) == {(-4, 2): ['s'], (0, 0): ['r']}
+    assert state.num_friends() == 3
+    assert state.num_enemies() == 2
+    assert state.symbol_counts(is_friend=True) == [2, 1, 0]
+
+
+def test_copy_is_independent():
+    state = GameState(friends={(0, 0): ['r']}, enemies={(-4, 2): ['s']})
+    copied = state.copy()
+    copied.update(*encoded(('SLIDE', (0, 0), (0, 1)), ('THROW', 'p', (-4, 3))))
+    assert state.friends == {(0, 0): ['r']}
+    assert state.enemies == {(-4, 2): ['s']}
+    assert copied.friends == {(0, 1): ['r']}
+    assert sorted_stacks(copied.enemies) == {(-4, 2): ['s'], (-4, 3): ['p']}
+    assert copied.enemy_throws == 1
+
+
+def test_battle_two_symbols():
+    """
+    Rock defeats the enemy scissors that moves on to its hex, tokens of the same symbol don't battle
+    """
+    state = GameState(friends={(0, 0): ['r'], (1, 0): ['s']}, enemies={(0, 1): ['s', 's']})
+    state.update(*encoded(('SLIDE', (1, 0), (0, 1)), ('SLIDE', (0, 1), (0, 0))))
+    assert state.friends == {(0, 0): ['r'], (0, 1): ['s']}
+    assert state.enemies == {(0, 1): ['s']}
+
+
+def test_battle_three_symbols():
+    """
+    All tokens are defeated when every symbol is on the hex
+    """
+    state = GameState(
+        friend_throws=2, enemy_throws=1, friends={(0, 0): ['r'], (1, 0): ['p']}, enemies={(0, 1): ['s']})
+    state.update(*encoded(('SLIDE', (1, 0), (0, 0)), ('SLIDE', (0, 1), (0, 0))))
+    assert state.friends == {}
+    assert state.enemies == {}
+    assert state.num_kills() == 1
+    assert state.num_deaths() == 2
+
+
+def test_swing_transitions():
+    """
+    A token can swing over an adjacent ally to the hexes beyond it
+    """
+    state = GameState(friend_throws=9, enemy_throws=9, friends={(0, 0): ['r'], (0, 1): ['p']})
+    swings = set(map(GameState.decode_move, state.next_swing_transitions(is_friend=True)))
+    assert ('SWING', (0, 0), (0, 2)) in swings
+    assert ('SWING', (0, 0), (-1, 2)) in swings
+    assert ('SWING', (0, 0), (1, 1)) in swings
+    assert ('SWING', (0, 0), (1, 0)) not in swings  # can be reached with a slide
+    assert len(state.next_slide_transitions(is_friend=True)) == 12
+
+
+def test_incremental_key_matches_fresh_key():
+    """
+    The incrementally updated Zobrist key equals the key of the same position built from scratch
+    """
+    state = GameState(friends={(0, 0): ['r'], (1, 0): ['s']}, enemies={(0, 1): ['s', 's']})
+    moves = [
+        (('SLIDE', (1, 0), (0, 1)), ('SLIDE', (0, 1), (0, 0))),
+        (('THROW', 'p', (4, -2)), ('THROW', 'r', (-4, 2))),
+        (('SWING', (0, 1), (-1, 0)), ('SLIDE', (-4, 2), (-3, 1))),
+    ]
+    for friend_move, enemy_move in moves:
+        state.update(*encoded(friend_move, enemy_move))
+        fresh = GameState(
+            friend_throws=state.friend_throws, enemy_throws=state.enemy_throws,
+            friends=state.friends, enemies=state.enemies)
+        assert state.key == fresh.key
+
+
+def test_key_includes_enemies_and_throws():
+    state = GameState(friends={(0, 0): ['r']}, enemies={(0, 1): ['s']})
+    assert state.key != GameState(friends={(0, 0): ['r']}, enemies={(0, 2): ['s']}).key
+    assert state.key != GameState(friends={(0, 0): ['r']}, enemies={(0, 1): ['p']}).key
+    assert state.key != GameState(friends={(0, 1): ['s']}, enemies={(0, 0): ['r']}).key
+    assert state.key != GameState(enemy_throws=1, friends={(0, 0): ['r']}, enemies={(0, 1): ['s']}).key
+
+
+def test_repeated_position_is_counted():
+    """
+    Moving back and forth repeats the starting position, the third occurrence reaches the limit
+    """
+    state = GameState(friend_throws=1, enemy_throws=1, friends={(0, 0): ['r']}, enemies={(-4, 2): ['s']})
+    forth = (('SLIDE', (0, 0), (0, 1)), ('SLIDE', (-4, 2), (-4, 3)))
+    back = (('SLIDE', (0, 1), (0, 0)), ('SLIDE', (-4, 3), (-4, 2)))
+    state.update(*encoded(*forth))
+    state.update(*encoded(*back))
+    state.update(*encoded(*forth))
+    assert not state.existing_moves.limit_reached
+    state.update(*encoded(*back))
+    assert state.existing_moves.limit_reached
+
+
+def test_apply_and_undo_restore_the_state():
+    state = GameState(
+        friend_throws=3, enemy_throws=2,
+        friends={(0, 0): ['r'], (1, 0): ['p', 'p']}, enemies={(0, 1): ['s'], (-2, 1): ['r']})
+    before = (state.friends, state.enemies, state.key, state.existing_moves.counts())
+    moves = [
+        (('SLIDE', (1, 0), (0, 0)), ('SLIDE', (0, 1), (0, 0))),  # every symbol meets on (0, 0)
+        (('SWING', (0, 0), (2, 0)), ('THROW', 'p', (-4, 2))),
+        (('SLIDE', (0, 0), (0, 1)), None),  # rock defeats the scissors
+    ]
+    for friend_move, enemy_move in moves:
+        friend_move, enemy_move = encoded(friend_move, enemy_move)
+        expected = state.copy()
+        expected.update(friend_move, enemy_move)
+        token = state.apply(friend_move, enemy_move)
+        assert (state.friends, state.enemies, state.key) == (expected.friends, expected.enemies, expected.key)
+        state.undo(token)
+        assert (state.friends, state.enemies, state.key, state.existing_moves.counts()) == before
+        assert (state.friend_throws, state.enemy_throws, state.turn) == (3, 2, 0)
+
+
+def test_distance_field():
+    state = GameState(friends={(0, 0): ['r'], (3, 0): ['r']}, enemies={(-4, 2): ['s']})
+    field = state.distance_field(0)
+    assert GameState.field_distance(field, GameState.board.hex_index[(1, 0)]) == 1
+    assert GameState.field_distance(field, GameState.board.hex_index[(4, -2)]) == 2
+    assert GameState.field_distance(state.distance_field(1), 0) == GameState.NO_TOKEN_DISTANCE
+
+
+def test_move_encoding_round_trip():
+    """
+    Every generated move decodes to the referee format and encodes back to the same int
+    """
+    state = GameState(friend_throws=3, friends={(0, 0): ['r'], (0, 1): ['p'], (4, -2): ['s']})
+    for packed_move in state.next_friend_transitions():
+        assert GameState.encode_move(GameState.decode_move(packed_move)) == packed_move
+    assert GameState.decode_move(GameState.encode_move(('THROW', 's', (-4, 2)))) == ('THROW', 's', (-4, 2))
+    assert GameState.encode_move(None) is None
+
+
+def test_transitions_are_generated_slides_swings_then_throws():
+    state = GameState(
+        friend_throws=4, enemy_throws=2,
+        friends={(0, 0): ['r'], (0, 1): ['p'], (1, 0): ['s']}, enemies={(-2, 1): ['r'], (-4, 2): ['p']})
+    for is_friend in (True, False):
+        assert state.next_transitions_for_side(is_friend) == (
+            state.next_slide_transitions(is_friend) + state.next_swing_transitions(is_friend)
+            + state.next_throw_transitions(is_friend))
+    num_pairs = len(state.next_friend_transitions()) * len(state.next_enemy_transitions())
+    assert len(list(state.next_transitions())) == num_pairs
+
+
+def test_move_cache_is_shared_between_copies():
+    GameState.move_cache.clear()
+    state = GameState(friend_throws=2, friends={(0, 0): ['r'], (0, 1): ['p']}, enemies={(-4, 2): ['s']})
+    moves = state.next_friend_transitions()
+    misses = GameState.move_cache.misses
+    copied = state.copy()
+    copied.update(None, GameState.encode_move(('SLIDE', (-4, 2), (-4, 3))))
+    # the friend tokens are unchanged, so the slides and swings come from the cache
+    assert copied.next_friend_transitions() == moves
+    assert GameState.move_cache.misses == misses
+    assert GameState.move_cache.hits == 1
+
+
+def test_history_is_shared_with_copies():
+    """
+    Copies see the occurrences recorded before the copy but not those added to other copies
+    """
+    state = GameState(friend_throws=1, enemy_throws=1, friends={(0, 0): ['r']}, enemies={(-4, 2): ['s']})
+    start = state.key
+    forth = encoded(('SLIDE', (0, 0), (0, 1)), ('SLIDE', (-4, 2), (-4, 3)))
+    back = encoded(('SLIDE', (0, 1), (0, 0)), ('SLIDE', (-4, 3), (-4, 2)))
+    state.update(*forth)
+    copied = state.copy()
+    state.update(*back)
+    assert state.existing_moves.count(start) == 2
+    assert copied.existing_moves.count(start) == 1
+    for _ in range(40):
+        copied = copied.copy()
+        copied.update(*back)
+        copied = copied.copy()
+        copied.update(*forth)
+    assert copied.existing_moves.count(start) == 41
+    assert copied.existing_moves.history.depth <= ExistingMoves.MAX_HISTORY_DEPTH
+
+
+def test_symbol_counts_follow_battles_and_undo():
+    state = GameState(
+        friend_throws=3, enemy_throws=2,
+        friends={(0, 0): ['r', 'r'], (1, 0): ['p']}, enemies={(0, 1): ['s'], (-2, 1): ['r']})
+    token = state.apply(*encoded(('SLIDE', (1, 0), (0, 1)), ('SLIDE', (0, 1), (0, 0))))
+    # the enemy scissors is defeated by the friend rocks, the friend paper survives
+    assert state.symbol_counts(is_friend=True) == [2, 1, 0]
+    assert state.symbol_counts(is_friend=False) == [1, 0, 0]
+    assert state.num_enemies() == 1
+    state.undo(token)
+    assert state.symbol_counts(is_friend=False) == [1, 0, 1]
+    assert state.copy().symbol_counts(is_friend=True) == [2, 1, 0]
+
+
+def test_throws_near_an_enemy_are_kept():
+    """
+    With an enemy one row from the throw zone only throws next to an enemy they defeat are kept
+    """
+    state = GameState(friends={(4, -2): ['r']}, enemies={(3, -1): ['s'], (-4, 2): ['r']}, pruning_is_aggressive=False)
+    throws = set(map(GameState.decode_move, state.next_throw_transitions(is_friend=True)))
+    assert throws == {('THROW', 'r', (4, -2)), ('THROW', 'r', (4, -1))}
@@ -9,6 +9,16 @@ import numpy as np
 from state.node_mcts_duct import Node
 from strategy.mcts_duct import simple_reduction, monte_carlo_tree_search
 
+
+def two_token_node():
+    """
+    A new root with two tokens and two throws left for each side
+    """
+    return Node(GameState(
+        friend_throws=2, enemy_throws=2,
+        friends={(0, 0): ['r'], (1, -1): ['p']}, enemies={(0, 2): ['s'], (-2, 1): ['p']}))
+
+
 def test_1():
     """
     Test function to investigate the MCTS code with a minimal possible actions.
@@ -21,7 +31,8 @@ def test_1():
     node.friends = {(-3, 0): ['r'], (3, 1): ['s']}
     node.enemies = {(-4, 0): ['s'], (-4, 4): ['p']}
     result = simple_reduction(node)
-    print(result.action)
+    assert result in node.friend_transitions
+    print(GameState.decode_move(result))
 
 
 def test_2():
@@ -64,7 +75,7 @@ def test_2():
                     (-2, -1): ['p'], (-1, 3): ['s']}
     # simple_reduction(node)
     monte_carlo_tree_search(node, num_iterations=10,
-                            playout_amount=3, node_cutoff=10)
+                            playout_amount=3)
 
 
 def test_3():
@@ -106,7 +117,7 @@ def test_3():
     node.enemies = {(-4, 0): ['r'], (1, -4): ['s']}
     simple_reduction(node)
     monte_carlo_tree_search(node, num_iterations=300,
-                            playout_amount=3, node_cutoff=5)
+                            playout_amount=3)
 
 
 def test_4():
@@ -151,12 +162,10 @@ def test_4():
     monte_carlo_tree_search(
         node,
         playout_amount=3,
-        node_cutoff=3,
         outer_cutoff=7,
         num_iterations=900,
         # turn_time=2,
         exploration_constant=0.8,
-        use_slow_culling=False,
         verbosity=2,
     )
 
@@ -203,10 +212,100 @@ def test_5():
     monte_carlo_tree_search(
         node,
         playout_amount=3,
-        node_cutoff=3,
         num_iterations=900,
         turn_time=2,
         exploration_constant=0.8,
-        use_slow_culling=False,
         verbosity=2,
     )
+
+
+def test_cascade_pruning_is_checked():
+    """
+    Prune with a cascade shortlist, checking every pruning against evaluating every move
+    """
+    import strategy.mcts_duct as mcts_duct
+    node = two_token_node()
+    node.friend_transitions = node.next_friend_transitions()
+    node.enemy_transitions = node.next_enemy_transitions()
+    context = mcts_duct.SearchContext(outer_cutoff=4, cascade_size=8, cascade_check=1)
+    mcts_duct.prune_transitions(node, context)
+    assert len(node.friend_transitions) == 4 and len(node.enemy_transitions) == 4
+    stats = context.cascade_stats
+    assert stats.prunings == 1 and stats.checks == 1
+    assert stats.evaluated == 16 < stats.candidates
+
+
+def test_row_and_column_sums_follow_back_propagation():
+    import strategy.mcts_duct as mcts_duct
+    node = two_token_node()
+    context = mcts_duct.SearchContext(outer_cutoff=4)
+    mcts_duct.add_children(node, context)
+    # Only the prior visits, no children are made until they are selected
+    assert all(child is None for row in node.matrix for child in row)
+    assert list(node.row_visits) == [context.num_prior_visits * len(node.enemy_transitions)] * 4
+    child = node.make_child(1, 2)
+    assert (child.i, child.j) == (1, 2) and node.matrix[1][2] is child
+    row_visits, col_scores = node.row_visits[1], node.col_scores[2]
+    mcts_duct.back_propagate(child, 1)
+    assert node.row_visits[1] == row_visits + 1 and node.col_scores[2] == col_scores + 1
+    assert mcts_duct.sum_stats(node, 1, is_row=True) == (node.row_scores[1], node.row_visits[1])
+
+
+def test_searches_with_their_own_contexts():
+    """
+    Searches in the same process don't share settings or random numbers, the same seed gives
+    the same search whatever runs in between
+    """
+    from strategy.mcts_duct import SearchContext, search
+    first = two_token_node()
+    first_move = search(first, SearchContext(outer_cutoff=4, num_iterations=40, seed=7))
+    other = SearchContext(outer_cutoff=3, num_iterations=40, exploration_constant=2, seed=8)
+    search(two_token_node(), other)
+    second = two_token_node()
+    assert search(second, SearchContext(outer_cutoff=4, num_iterations=40, seed=7)) == first_move
+    assert list(second.row_visits) == list(first.row_visits)
+    assert len(second.friend_transitions) == 4 and other.rollout_count > 0
+
+
+def test_leaf_batches_remove_their_virtual_losses():
+    from strategy.mcts_duct import SearchContext, add_children, search
+    for playout_amount, use_ml_leaf_eval in ((3, False), (0, False), (0, True)):
+        node = two_token_node()
+        context = SearchContext(
+            playout_amount=playout_amount, outer_cutoff=4, num_iterations=50, leaf_batch=8,
+            use_ml_leaf_eval=use_ml_leaf_eval, seed=3)
+        add_children(node, context)
+        priors = [node.row_visits.sum(), node.row_scores.sum(), node.col_visits.sum(), node.col_scores.sum()]
+        search(node, context)
+        # Only the 50 results are left on top of the priors, the last batch is cut short
+        assert node.num_visits == 50
+        assert node.row_visits.sum() == priors[0] + 50 and node.col_visits.sum() == priors[2] + 50
+        assert np.isclose(node.row_scores.sum(), priors[1] + node.q_value)
+        assert np.isclose(node.col_scores.sum(), priors[3] + node.q_value)
+
+
+def test_root_parallel_statistics_are_merged_by_move():
+    from strategy.mcts_duct import choose_winner
+    from strategy.mcts_duct_parallel import merge_root_statistics, root_parallel_search, close_pool
+    node = Node(GameState(friends={(0, 0): ['r']}, enemies={(0, 2): ['s']}))
+    a, b, c = node.next_friend_transitions()[:3]
+    x, y = node.next_enemy_transitions()[:2]
+    merge_root_statistics(node, [
+        ([a, b], [x], np.array([3., 1.]), np.array([2., -1.]), np.array([4.]), np.array([1.]), 4, 1., 12),
+        ([b, c], [x, y], np.array([5., 1.]), np.array([1., 0.]), np.array([2., 4.]), np.array([0., 1.]), 6, 1., 12),
+        ([], [], None, None, None, None, 0, 0, 0),
+    ])
+    assert node.friend_transitions == [a, b, c] and node.enemy_transitions == [x, y]
+    assert list(node.row_visits) == [3, 6, 1] and list(node.row_scores) == [2, 0, 0]
+    assert list(node.col_visits) == [6, 4] and node.num_visits == 10 and node.q_value == 2
+    assert node.branching == 12
+    assert choose_winner(node)[0] == b
+
+    root = Node(node.copy())
+    try:
+        result = root_parallel_search(root, num_workers=2, seed=1, num_iterations=20)
+    finally:
+        close_pool()
+    assert result in node.next_friend_transitions()
+    assert root.branching == len(node.next_friend_transitions()) * len(node.next_enemy_transitions())
+